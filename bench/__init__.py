@@ -0,0 +1,5 @@
+"""
+오프라인 벤치마크: 유튜브/디스코드 없이 main.py의 재생 루프, 패널, 슬래시 커맨드 성능 측정.
+
+실행: python -m bench [--guilds 1,100,1000] [--queue 10,5000]
+"""
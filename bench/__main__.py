@@ -0,0 +1,288 @@
+import argparse
+import asyncio
+import os
+import random
+import struct
+import time
+from typing import Callable, Dict, List, Optional
+
+# main.py는 import 시점에 환경변수를 읽으므로 디스크 캐시/메트릭 서버는 먼저 꺼 둠
+os.environ.setdefault("RESOLVE_DB_PATH", "")
+os.environ.setdefault("AUDIO_CACHE_DIR", "")
+os.environ.setdefault("METRICS_PORT", "0")
+
+from bench import fakes
+
+fakes.install_fake_ytdl()
+
+import main  # noqa: E402
+
+# ==============================
+# 집계 유틸
+# ==============================
+def percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    idx = min(len(values) - 1, max(0, int(round(q * (len(values) - 1)))))
+    return values[idx]
+
+def fmt_ms(v: Optional[float]) -> str:
+    return "-" if v is None else f"{v * 1000:.1f}ms"
+
+def track_gaps(records: List[fakes.PlayRecord]) -> List[float]:
+    by_guild: Dict[int, List[fakes.PlayRecord]] = {}
+    for r in records:
+        by_guild.setdefault(r.guild_id, []).append(r)
+    gaps = []
+    for rs in by_guild.values():
+        rs.sort(key=lambda r: r.play_ts)
+        for prev, nxt in zip(rs, rs[1:]):
+            if prev.end_ts is not None:
+                gaps.append(max(0.0, nxt.play_ts - prev.end_ts))
+    return gaps
+
+# ==============================
+# 시나리오
+# ==============================
+def reset_main_state():
+    main.music_data.clear()
+    main.track_cache._entries.clear()
+    main.track_cache._aliases.clear()
+    fakes.CONFIG.calls = {"single": 0, "playlist": 0}
+
+async def run_scenario(
+    guild_count: int, queue_size: int, plays_per_guild: int, track_real_sec: float, timeout: float, spawn_latency: float
+) -> dict:
+    reset_main_state()
+    main.bot.loop = asyncio.get_running_loop()
+
+    records: List[fakes.PlayRecord] = []
+    rest = fakes.RestCounter()
+    lag = fakes.LoopLagProbe()
+    async def fake_audio_source(track, local_path=None, start_sec=0.0, guild_id=0):
+        # 프레임 수는 곡 길이만큼(재생 위치 추적이 정상 종료로 보도록). 실제 시간은 track_real_sec
+        length = (track.duration or track_real_sec) - start_sec
+        # ffmpeg 기동 + 첫 바이트까지 걸리는 시간 흉내
+        await asyncio.sleep(spawn_latency)
+        return fakes.FakeAudioSource(max(2, int(length / 0.02)))
+
+    main.make_audio_source = fake_audio_source
+    # 가짜 곡은 실제 곡보다 훨씬 짧으므로 "즉시 실패" 기준도 곡 길이에 맞춰 줄임
+    main.EARLY_FAIL_SEC = track_real_sec / 4
+    # 곡이 배속으로 흐르므로 미리 띄우기까지 자는 시간도 배속에 맞춤
+    speed = fakes.CONFIG.track_duration / track_real_sec
+    main.PLAYBACK_CLOCK_RATE = speed
+    # 미리 띄우기 여유도 배속에 맞춤(가짜 ffmpeg 기동 시간의 2배를 곡 시간으로 환산)
+    main.GAPLESS_PRESPAWN_SEC = min(fakes.CONFIG.track_duration / 2, max(5.0, spawn_latency * speed * 2))
+
+    base_id = random.randrange(10**6) * 10**5
+    guilds = [fakes.FakeGuild(base_id + i, track_real_sec, records, rest) for i in range(guild_count)]
+
+    reply_latency: Dict[str, List[float]] = {"play": [], "shuffle_cmd": [], "queue_remove": []}
+    start = time.monotonic()
+    lag.start()
+
+    # 1) 모든 길드에서 동시에 /재생 <플레이리스트>
+    play_inters = [fakes.FakeInteraction(g) for g in guilds]
+    play_tasks = [
+        asyncio.create_task(main.play.callback(inter, f"https://www.youtube.com/playlist?list={queue_size}&g={g.id}"))
+        for g, inter in zip(guilds, play_inters)
+    ]
+
+    # 2) 대기열이 찬 길드마다 /셔플, /취소 한 번씩
+    async def commands_for(g: fakes.FakeGuild):
+        music = main.get_music(g.id)
+        while len(music.queue) < 2:
+            await asyncio.sleep(0.01)
+            if time.monotonic() - start > timeout:
+                return
+        inter = fakes.FakeInteraction(g)
+        await main.shuffle_cmd.callback(inter)
+        if inter.reply_latency is not None:
+            reply_latency["shuffle_cmd"].append(inter.reply_latency)
+
+        inter = fakes.FakeInteraction(g)
+        await main.queue_remove.callback(inter, max(1, len(music.queue) // 2))
+        if inter.reply_latency is not None:
+            reply_latency["queue_remove"].append(inter.reply_latency)
+
+    cmd_tasks = [asyncio.create_task(commands_for(g)) for g in guilds]
+
+    # 3) 길드마다 plays_per_guild곡이 끝날 때까지(또는 시간 초과) 대기
+    target = min(plays_per_guild, max(1, queue_size - 1))
+    while time.monotonic() - start < timeout:
+        done: Dict[int, int] = {}
+        for r in records:
+            if r.end_ts is not None:
+                done[r.guild_id] = done.get(r.guild_id, 0) + 1
+        if all(done.get(g.id, 0) >= target for g in guilds):
+            break
+        await asyncio.sleep(0.05)
+    wall = time.monotonic() - start
+    await lag.stop()
+
+    for inter in play_inters:
+        if inter.reply_latency is not None:
+            reply_latency["play"].append(inter.reply_latency)
+
+    # 4) 정리
+    for t in cmd_tasks:
+        t.cancel()
+    for g in guilds:
+        if g.id in main.music_data:
+            await main.do_leave(g, main.music_data[g.id])
+    for t in play_tasks:
+        t.cancel()
+    await asyncio.gather(*play_tasks, *cmd_tasks, return_exceptions=True)
+
+    played = sum(1 for r in records if r.end_ts is not None)
+    gaps = track_gaps(records)
+    return {
+        "guilds": guild_count,
+        "queue": queue_size,
+        "wall": wall,
+        "played": played,
+        "throughput": played / wall if wall else 0.0,
+        "gap_p50": percentile(gaps, 0.5),
+        "gap_p95": percentile(gaps, 0.95),
+        "gap_max": max(gaps) if gaps else None,
+        "reply": {k: (percentile(v, 0.5), percentile(v, 0.95)) for k, v in reply_latency.items()},
+        "lag_p50": percentile(lag.lags, 0.5),
+        "lag_p95": percentile(lag.lags, 0.95),
+        "lag_max": max(lag.lags) if lag.lags else None,
+        "extract_calls": dict(fakes.CONFIG.calls),
+        "rest": dict(rest.calls),
+    }
+
+# ==============================
+# 음성 작업자 IPC 확인(스레드 모드 + 대역 소스)
+# ==============================
+def wait_until(cond: Callable[[], bool], timeout: float = 2.0) -> bool:
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        if cond():
+            return True
+        time.sleep(0.01)
+    return cond()
+
+def read_packets(source, n: Optional[int] = None) -> List[int]:
+    out = []
+    while n is None or len(out) < n:
+        data = source.read()
+        if not data:
+            break
+        out.append(struct.unpack(">I", data)[0])
+    return out
+
+def run_voice_ipc_check() -> Dict[str, bool]:
+    """
+    출력값: 확인 항목 -> 통과 여부
+    - VoiceWorkerPool을 스레드 전송으로 띄우고 VOICE_WORKER_SOURCE로 대역 소스를 꽂아서
+      패킷 순서 / credit 역압 / close·release / 작업자 종료 후 복구를 확인
+    """
+    main.VOICE_WORKER_SOURCE = "bench.fakes:open_numbered_source"
+    opened = fakes.NumberedOpusSource.opened
+    buffer, step = main.VOICE_WORKER_BUFFER_PACKETS, main.VOICE_WORKER_CREDIT_STEP
+    pool = main.VoiceWorkerPool(2, main.spawn_voice_worker_thread)
+    checks: Dict[str, bool] = {}
+    try:
+        # 1) 순서: 보낸 순번 그대로, 끝은 에러 없이
+        src = pool.open(1, {"path": "fake://order/600"})
+        checks["packet order"] = read_packets(src) == list(range(1, 601)) and src._current_error is None
+        src.cleanup()
+
+        # 2) 역압: 안 읽으면 buffer개에서 멈추고, 읽은 만큼(step 단위)만 더 보냄
+        src = pool.open(2, {"path": "fake://credit/5000"})
+        wait_until(lambda: "credit" in opened and opened["credit"].produced >= buffer)
+        time.sleep(0.1)
+        held = opened["credit"].produced
+        got = read_packets(src, 2 * step)
+        wait_until(lambda: opened["credit"].produced >= buffer + 2 * step)
+        time.sleep(0.1)
+        checks["credit back-pressure"] = held == buffer and opened["credit"].produced == buffer + 2 * step and got == list(range(1, 2 * step + 1))
+
+        # 3) close/release: 작업자 쪽 소스 정리 + 길드 배정/스트림 수 해제
+        src.cleanup()
+        checks["close/release"] = (
+            wait_until(lambda: opened["credit"].cleaned)
+            and sum(pool.load()) == 0
+            and 2 not in pool._guild_worker
+        )
+
+        # 4) 작업자 종료: 받아 둔 패킷은 다 나오고 에러로 끝남 -> 다음에 열 때 새 작업자
+        src = pool.open(3, {"path": "fake://death/5000"})
+        wait_until(lambda: "death" in opened and opened["death"].produced >= buffer)
+        dead = src.worker
+        dead.send({"op": "stop"})
+        wait_until(lambda: not dead.alive)
+        drained = read_packets(src)
+        src.cleanup()
+        again = pool.open(3, {"path": "fake://again/10"})
+        checks["worker death"] = (
+            drained == list(range(1, len(drained) + 1))
+            and src._current_error is not None
+            and again.worker is not dead
+            and read_packets(again) == list(range(1, 11))
+        )
+        again.cleanup()
+    finally:
+        pool.close()
+    return checks
+
+def print_report(r: dict):
+    print(f"== 길드 {r['guilds']} / 대기열 {r['queue']} ==")
+    print(f"  소요 {r['wall']:.2f}s | 재생 완료 {r['played']}곡 | 처리량 {r['throughput']:.1f}곡/s")
+    print(f"  곡 사이 공백 p50 {fmt_ms(r['gap_p50'])} p95 {fmt_ms(r['gap_p95'])} 최대 {fmt_ms(r['gap_max'])}")
+    for name, (p50, p95) in r["reply"].items():
+        print(f"  /{name} 첫 응답 p50 {fmt_ms(p50)} p95 {fmt_ms(p95)}")
+    print(f"  이벤트 루프 지연 p50 {fmt_ms(r['lag_p50'])} p95 {fmt_ms(r['lag_p95'])} 최대 {fmt_ms(r['lag_max'])}")
+    print(f"  추출 호출 {r['extract_calls']} | 패널/메시지 REST {r['rest']}")
+
+async def amain(args):
+    if args.voice_ipc:
+        checks = await asyncio.to_thread(run_voice_ipc_check)
+        print("== 음성 작업자 IPC(스레드 전송) ==")
+        for name, ok in checks.items():
+            print(f"  {name}: {'OK' if ok else 'FAIL'}")
+        if not all(checks.values()):
+            raise SystemExit(1)
+        return
+
+    fakes.CONFIG.single_latency = args.single_latency
+    fakes.CONFIG.page_latency = args.page_latency
+    fakes.CONFIG.failure_rate = args.failure_rate
+    fakes.CONFIG.track_duration = args.track_duration
+    main.PLAYBACK_GAPLESS = not args.no_gapless
+
+    for g in args.guilds:
+        for q in args.queue:
+            if g * q > args.max_tracks:
+                print(f"== 길드 {g} / 대기열 {q} == 건너뜀(총 {g * q}곡 > --max-tracks {args.max_tracks})")
+                continue
+            r = await run_scenario(g, q, args.plays, args.track_sec, args.timeout, args.spawn_latency)
+            print_report(r)
+
+def int_list(s: str) -> List[int]:
+    return [int(x) for x in s.split(",") if x.strip()]
+
+def main_cli():
+    p = argparse.ArgumentParser(prog="python -m bench", description="main.py 오프라인 벤치마크")
+    p.add_argument("--guilds", type=int_list, default=[1, 100, 1000], help="길드 수 목록(쉼표 구분)")
+    p.add_argument("--queue", type=int_list, default=[10, 5000], help="플레이리스트 크기 목록(쉼표 구분)")
+    p.add_argument("--plays", type=int, default=5, help="길드마다 끝까지 재생할 곡 수")
+    p.add_argument("--track-sec", type=float, default=0.5, help="가짜 곡 1개 재생 시간(실제 초)")
+    p.add_argument("--track-duration", type=int, default=30, help="가짜 곡 길이(초, 메타데이터 기준)")
+    p.add_argument("--no-gapless", action="store_true", help="다음 곡 미리 띄우기 끄고 측정")
+    p.add_argument("--single-latency", type=float, default=0.05, help="가짜 단일곡 추출 지연(초)")
+    p.add_argument("--page-latency", type=float, default=0.05, help="가짜 플리 페이지(100곡) 지연(초)")
+    p.add_argument("--spawn-latency", type=float, default=0.15, help="가짜 오디오 소스 생성 지연(ffmpeg 기동, 초)")
+    p.add_argument("--failure-rate", type=float, default=0.0, help="가짜 추출 실패 확률(0~1)")
+    p.add_argument("--timeout", type=float, default=120.0, help="시나리오당 최대 시간(초)")
+    p.add_argument("--voice-ipc", action="store_true", help="음성 작업자 IPC 프로토콜만 대역 소스로 확인하고 끝냄")
+    p.add_argument("--max-tracks", type=int, default=600_000, help="길드 수 x 대기열 크기 상한")
+    args = p.parse_args()
+    asyncio.run(amain(args))
+
+if __name__ == "__main__":
+    main_cli()
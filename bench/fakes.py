@@ -0,0 +1,459 @@
+import asyncio
+import itertools
+import random
+import struct
+import threading
+import time
+import zlib
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+import discord
+import yt_dlp
+
+# ==============================
+# 가짜 yt-dlp
+# ==============================
+@dataclass
+class FakeYtdlConfig:
+    # 단일곡 추출 1회 지연(초) / 플리 페이지(100곡) 하나 지연(초)
+    single_latency: float = 0.05
+    page_latency: float = 0.05
+    # 추출 실패 확률(0~1)
+    failure_rate: float = 0.0
+    # 곡 길이(초, 메타데이터용)
+    track_duration: int = 30
+    seed: int = 1234
+    calls: Dict[str, int] = field(default_factory=lambda: {"single": 0, "playlist": 0})
+
+    def __post_init__(self):
+        self._rng = random.Random(self.seed)
+        self._lock = threading.Lock()
+
+    def roll_failure(self) -> bool:
+        with self._lock:
+            return self._rng.random() < self.failure_rate
+
+    def count(self, kind: str):
+        with self._lock:
+            self.calls[kind] += 1
+
+
+CONFIG = FakeYtdlConfig()
+
+def fake_video_id(n: int) -> str:
+    return f"v{n:010d}"
+
+class FakeYoutubeDL:
+    """
+    yt_dlp.YoutubeDL 대역.
+    - "list=<개수>" 가 들어간 URL은 플레이리스트(process=False면 페이지 단위로 지연되는 제너레이터)
+    - 그 외는 단일곡: 검색어/URL에서 결정적인 영상 ID를 만들어 돌려줌
+    """
+    def __init__(self, params: Optional[dict] = None):
+        self.params = params or {}
+
+    def get_info_extractor(self, name: str):
+        return None
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def extract_info(self, url: str, download: bool = False, ie_key=None, extra_info=None, process: bool = True, **kw):
+        if "list=" in url:
+            return self._playlist(url, process)
+        return self._single(url)
+
+    def _fail(self, what: str):
+        raise yt_dlp.utils.DownloadError(f"ERROR: [fake] {what}: 가짜 실패")
+
+    def _single(self, query: str) -> dict:
+        CONFIG.count("single")
+        time.sleep(CONFIG.single_latency)
+        if CONFIG.roll_failure():
+            self._fail(query)
+
+        vid = None
+        if "v=" in query:
+            vid = query.split("v=", 1)[1][:11]
+        if not vid:
+            vid = fake_video_id(zlib.crc32(query.encode()) % 10**10)
+        expire = int(time.time()) + 6 * 60 * 60
+        return {
+            "id": vid,
+            "title": f"곡 {vid}",
+            "webpage_url": f"https://www.youtube.com/watch?v={vid}",
+            "url": f"https://rr1.googlevideo.com/videoplayback?expire={expire}&itag=251&mime=audio%2Fwebm&id={vid}",
+            "duration": CONFIG.track_duration,
+            "thumbnail": f"https://i.ytimg.com/vi/{vid}/hqdefault.jpg",
+        }
+
+    def _playlist(self, url: str, process: bool) -> dict:
+        CONFIG.count("playlist")
+        size = int(url.rsplit("list=", 1)[1].split("&", 1)[0] or 0)
+        base = zlib.crc32(url.encode()) % 10**6 * 10**4
+
+        def entries():
+            for n in range(size):
+                if n % 100 == 0:
+                    time.sleep(CONFIG.page_latency)
+                    if CONFIG.roll_failure():
+                        self._fail(url)
+                vid = fake_video_id(base + n)
+                yield {
+                    "_type": "url",
+                    "url": f"https://www.youtube.com/watch?v={vid}",
+                    "title": f"곡 {vid}",
+                }
+
+        return {
+            "_type": "playlist",
+            "entries": entries() if not process else list(entries()),
+        }
+
+
+def install_fake_ytdl():
+    # YtdlPool은 yt_dlp.YoutubeDL을 호출 시점에 찾으므로 모듈 속성만 바꾸면 됨
+    yt_dlp.YoutubeDL = FakeYoutubeDL
+
+# ==============================
+# 가짜 오디오 소스 / 보이스 클라이언트
+# ==============================
+class FakeAudioSource(discord.AudioSource):
+    def __init__(self, frames: int):
+        self.remaining = frames
+
+    def read(self) -> bytes:
+        if self.remaining <= 0:
+            return b""
+        self.remaining -= 1
+        return b"\xf8\xff\xfe"
+
+    def is_opus(self) -> bool:
+        return True
+
+
+class NumberedOpusSource(discord.AudioSource):
+    """
+    음성 작업자 프로토콜 확인용 대역 소스: 순번(1부터)이 든 패킷을 frames개 내보냄
+    - produced/cleaned로 작업자 쪽에서 얼마나 읽었는지, 정리됐는지 확인
+    """
+    opened: Dict[str, "NumberedOpusSource"] = {}
+
+    def __init__(self, frames: int):
+        self.frames = frames
+        self.produced = 0
+        self.cleaned = False
+
+    def read(self) -> bytes:
+        if self.produced >= self.frames:
+            return b""
+        self.produced += 1
+        return struct.pack(">I", self.produced)
+
+    def is_opus(self) -> bool:
+        return True
+
+    def cleanup(self):
+        self.cleaned = True
+
+
+def open_numbered_source(spec: dict) -> NumberedOpusSource:
+    # spec["path"] = "fake://<이름>/<패킷 수>" (VOICE_WORKER_SOURCE="bench.fakes:open_numbered_source")
+    name, frames = spec["path"][len("fake://"):].rsplit("/", 1)
+    source = NumberedOpusSource(int(frames))
+    NumberedOpusSource.opened[name] = source
+    return source
+
+
+@dataclass
+class PlayRecord:
+    guild_id: int
+    play_ts: float
+    end_ts: Optional[float] = None
+
+
+class FakeVoiceClient:
+    """
+    discord.VoiceClient 대역.
+    - play(): 곡 하나가 실제 track_real_sec 동안 끝나도록 배속으로 프레임을 읽고, 다 읽으면 after() 호출
+    - 실제 AudioPlayer처럼 after() 다음에 cleanup()
+    - after()는 실제처럼 다른 스레드 문맥이 아니라 이벤트 루프에서 바로 부름(call_soon_threadsafe는 그대로 동작)
+    """
+    def __init__(self, guild: "FakeGuild", channel: "FakeVoiceChannel", track_real_sec: float, records: List[PlayRecord]):
+        self.guild = guild
+        self.channel = channel
+        self.track_real_sec = track_real_sec
+        self.records = records
+        self._connected = True
+        self._playing = False
+        self._paused = False
+        self._task: Optional[asyncio.Task] = None
+        self._stop = asyncio.Event()
+
+    def is_connected(self) -> bool:
+        return self._connected
+
+    def is_playing(self) -> bool:
+        return self._playing and not self._paused
+
+    def is_paused(self) -> bool:
+        return self._paused
+
+    def play(self, source: discord.AudioSource, *, after: Optional[Callable] = None, **kw):
+        if self._playing:
+            raise discord.ClientException("Already playing audio.")
+        self._playing = True
+        self._paused = False
+        self._stop = asyncio.Event()
+        rec = PlayRecord(self.guild.id, time.monotonic())
+        self.records.append(rec)
+        self._task = asyncio.get_running_loop().create_task(self._run(source, after, rec))
+
+    async def _run(self, source, after, rec: PlayRecord):
+        # 곡 하나(CONFIG.track_duration초 분량)가 실제 track_real_sec 동안 나가도록 배속으로 읽음
+        tick = 0.02
+        per_tick = max(1, round(CONFIG.track_duration / self.track_real_sec * tick / 0.02))
+        error = None
+        current = getattr(source, "current", source)
+        try:
+            while not self._stop.is_set():
+                if self._paused:
+                    await asyncio.sleep(tick)
+                    continue
+                data = b""
+                for _ in range(per_tick):
+                    data = source.read()
+                    if not data:
+                        break
+                    # 이어 붙이기 소스가 다음 곡으로 넘어가면 기록도 나눔
+                    now_current = getattr(source, "current", source)
+                    if now_current is not current:
+                        current = now_current
+                        rec.end_ts = time.monotonic()
+                        rec = PlayRecord(self.guild.id, rec.end_ts)
+                        self.records.append(rec)
+                if not data:
+                    break
+                await asyncio.sleep(tick)
+        except Exception as e:
+            error = e
+        finally:
+            rec.end_ts = time.monotonic()
+            self._playing = False
+            self._paused = False
+            if after is not None:
+                after(error)
+            try:
+                source.cleanup()
+            except Exception:
+                pass
+
+    def pause(self):
+        if self._playing:
+            self._paused = True
+
+    def resume(self):
+        self._paused = False
+
+    def stop(self):
+        self._stop.set()
+
+    async def disconnect(self, *, force: bool = False):
+        self.stop()
+        self._connected = False
+        if self.guild.voice_client is self:
+            self.guild.voice_client = None
+
+# ==============================
+# 가짜 길드 / 채널 / 메시지 / 멤버 / 인터랙션
+# ==============================
+_ids = itertools.count(10**15)
+
+class RestCounter:
+    def __init__(self):
+        self.calls: Dict[str, int] = {}
+
+    def hit(self, op: str):
+        self.calls[op] = self.calls.get(op, 0) + 1
+
+
+class FakeMessage:
+    def __init__(self, channel: "FakeTextChannel", content: Optional[str] = None):
+        self.id = next(_ids)
+        self.channel = channel
+        self.content = content
+
+    async def edit(self, **kw):
+        self.channel.rest.hit("message.edit")
+        self.content = kw.get("content", self.content)
+        return self
+
+    async def delete(self):
+        self.channel.rest.hit("message.delete")
+
+
+class FakeTextChannel:
+    def __init__(self, guild: "FakeGuild", rest: RestCounter):
+        self.id = next(_ids)
+        self.guild = guild
+        self.rest = rest
+
+    async def send(self, content: Optional[str] = None, **kw) -> FakeMessage:
+        self.rest.hit("channel.send")
+        return FakeMessage(self, content)
+
+    def get_partial_message(self, message_id: int) -> FakeMessage:
+        msg = FakeMessage(self)
+        msg.id = message_id
+        return msg
+
+
+class FakeVoiceChannel:
+    def __init__(self, guild: "FakeGuild", track_real_sec: float, records: List[PlayRecord]):
+        self.id = next(_ids)
+        self.name = "음성"
+        self.guild = guild
+        self.track_real_sec = track_real_sec
+        self.records = records
+
+    async def connect(self, **kw) -> FakeVoiceClient:
+        await asyncio.sleep(0)
+        vc = FakeVoiceClient(self.guild, self, self.track_real_sec, self.records)
+        self.guild.voice_client = vc
+        return vc
+
+
+class _FakeVoiceState:
+    def __init__(self, channel: FakeVoiceChannel):
+        self.channel = channel
+
+
+class FakeMember(discord.Member):
+    """
+    isinstance(x, discord.Member) 검사를 통과하는 최소 멤버(생성자 우회)
+    """
+    def __init__(self, member_id: int, channel: FakeVoiceChannel):
+        self._fake_id = member_id
+        self._fake_voice = _FakeVoiceState(channel)
+
+    @property
+    def id(self) -> int:
+        return self._fake_id
+
+    @property
+    def voice(self):
+        return self._fake_voice
+
+    @property
+    def display_name(self) -> str:
+        return f"user{self._fake_id % 1000}"
+
+    def __repr__(self) -> str:
+        return f"<FakeMember id={self._fake_id}>"
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int, track_real_sec: float, records: List[PlayRecord], rest: RestCounter):
+        self.id = guild_id
+        self.voice_client: Optional[FakeVoiceClient] = None
+        self.text_channel = FakeTextChannel(self, rest)
+        self.voice_channel = FakeVoiceChannel(self, track_real_sec, records)
+        self.member = FakeMember(next(_ids), self.voice_channel)
+
+    def get_member(self, member_id: int):
+        return self.member if member_id == self.member.id else None
+
+    def get_channel(self, channel_id: int):
+        if channel_id == self.text_channel.id:
+            return self.text_channel
+        return None
+
+    async def fetch_channel(self, channel_id: int):
+        ch = self.get_channel(channel_id)
+        if ch is None:
+            raise Exception("없는 채널")
+        return ch
+
+
+class FakeResponse:
+    def __init__(self, interaction: "FakeInteraction"):
+        self.interaction = interaction
+        self._done = False
+
+    def is_done(self) -> bool:
+        return self._done
+
+    async def defer(self, **kw):
+        self._done = True
+
+    async def send_message(self, content: Optional[str] = None, **kw):
+        self._done = True
+        self.interaction.mark_replied(content)
+
+
+class FakeFollowup:
+    def __init__(self, interaction: "FakeInteraction"):
+        self.interaction = interaction
+
+    async def send(self, content: Optional[str] = None, **kw) -> FakeMessage:
+        self.interaction.mark_replied(content)
+        return FakeMessage(self.interaction.guild.text_channel, content)
+
+
+class FakeInteraction:
+    """
+    discord.Interaction 대역. 첫 응답(send_message/followup) 시각을 기록해서 응답 지연을 잼
+    """
+    def __init__(self, guild: FakeGuild):
+        self.guild = guild
+        self.user = guild.member
+        self.channel_id = guild.text_channel.id
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+        self.created = time.monotonic()
+        self.first_reply_ts: Optional[float] = None
+        self.replies: List[Optional[str]] = []
+
+    def mark_replied(self, content: Optional[str]):
+        if self.first_reply_ts is None:
+            self.first_reply_ts = time.monotonic()
+        self.replies.append(content)
+
+    @property
+    def reply_latency(self) -> Optional[float]:
+        if self.first_reply_ts is None:
+            return None
+        return self.first_reply_ts - self.created
+
+# ==============================
+# 이벤트 루프 지연 측정
+# ==============================
+class LoopLagProbe:
+    """
+    interval_sec마다 깨어나서 예정보다 늦게 깨어난 만큼을 기록(명령/재생 처리 지터)
+    """
+    def __init__(self, interval_sec: float = 0.01):
+        self.interval_sec = interval_sec
+        self.lags: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(self.interval_sec)
+            self.lags.append(max(0.0, time.monotonic() - start - self.interval_sec))
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
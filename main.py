@@ -1,16 +1,40 @@
 import os
+import re
+import sys
+import random
+import copy
+import gzip
+import json
+import struct
+import hashlib
+import itertools
+import atexit
+import sqlite3
 import asyncio
+import threading
+import weakref
 import time
+import warnings
 import logging
-from collections import deque
+import multiprocessing
+from collections import deque, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager, contextmanager
 from dataclasses import dataclass
-from typing import Deque, Dict, Optional, List, Tuple
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, List, Tuple
+from urllib.parse import parse_qs, urlparse
 
 import discord
 from discord import app_commands
 from discord.ext import commands
 import yt_dlp
 
+# ✅ 크로스페이드 믹싱용(discord.py도 같은 모듈을 씀). 3.12에서 나오는 폐기 예정 경고는 숨김
+with warnings.catch_warnings():
+    warnings.simplefilter("ignore", DeprecationWarning)
+    import audioop
+
 # ==============================
 # ✅ 부팅/동기화 로그
 # ==============================
@@ -22,18 +46,41 @@ print("BOOT: main.py 실행됨", flush=True)
 # 설정
 # ==============================
 IDLE_TIMEOUT_SEC = 5 * 60
+# ✅ 퇴장(또는 유휴) 후 이만큼(초) 아무 명령이 없으면 길드 상태(GuildMusic)를 메모리에서 내림
+GUILD_STATE_TTL_SEC = float(os.getenv("GUILD_STATE_TTL_SEC", "60"))
 GUILD_ID = int(os.getenv("GUILD_ID", "0"))
+# ✅ 마지막으로 동기화한 슬래시 커맨드 해시 저장 파일(비우면 매번 동기화)
+COMMAND_SYNC_STATE_PATH = os.getenv("COMMAND_SYNC_STATE_PATH", "command_sync.json")
+# ✅ 1이면 해시가 같아도 부팅 때 한 번은 동기화
+COMMAND_SYNC_FORCE = os.getenv("COMMAND_SYNC_FORCE", "0") == "1"
+COMMAND_SYNC_TIMEOUT_SEC = 30
 
-PLAYLIST_LIMIT = 100  # ✅ 플레이리스트 최대 추가 곡 수
+PLAYLIST_LIMIT = int(os.getenv("PLAYLIST_LIMIT", "1000"))  # ✅ 플레이리스트 최대 추가 곡 수
+# ✅ 플리 적재 단위(첫 곡은 바로, 이후는 이만큼씩 묶어서 대기열에 추가)
+PLAYLIST_BATCH_SIZE = 25
 
 # ✅ 재생이 "즉시 실패"한 것으로 판단할 시간(초)
 EARLY_FAIL_SEC = 4.0
 # ✅ 즉시 실패 시 재추출/재시도 횟수(1회만)
 EARLY_FAIL_RETRY = 1
 
+# ✅ 곡 중간에 끊기면(URL 만료/연결 끊김) 끊긴 위치부터 이어 재생할 최대 횟수(곡당)
+MIDTRACK_RECOVERY_ATTEMPTS = int(os.getenv("MIDTRACK_RECOVERY_ATTEMPTS", "3"))
+# ✅ 곡 길이보다 이만큼(초) 넘게 모자라게 끝나면 비정상 종료로 봄
+MIDTRACK_END_SLACK_SEC = 5.0
+
 # ✅ 보이스 연결 타임아웃(초)
 VOICE_CONNECT_TIMEOUT = 20
 
+# ✅ 재생 중에 미리 스트림 URL을 뽑아 둘 대기열 앞쪽 곡 수(0이면 끔)
+PREFETCH_AHEAD = int(os.getenv("PREFETCH_AHEAD", "2"))
+
+# ✅ 패널 갱신: 이 시간(초) 안에 몰린 요청은 한 번의 수정으로 합침
+PANEL_DEBOUNCE_SEC = 0.3
+# ✅ 채널별 메시지 수정 횟수 제한(디스코드 버킷: 대략 5초에 5회)
+PANEL_EDITS_PER_WINDOW = 5
+PANEL_EDIT_WINDOW_SEC = 5.0
+
 # ==============================
 # 문구(통일)
 # ==============================
@@ -42,11 +89,20 @@ MSG_BOT_NOT_IN_VOICE = "지금 봇이 통화방에 없어."
 MSG_NEED_SAME_VOICE = "봇이 있는 통화방에 들어와야 쓸 수 있어."
 MSG_DIFF_VOICE_IN_USE = "다른 통화방에서 날 쓰는 중이야."
 MSG_BUSY = "지금 플레이리스트 처리중이야. 잠깐만."
+MSG_PLAYLIST_LOADING = "이미 플레이리스트를 불러오는 중이야. 다 끝나고 넣어줘."
 MSG_VOICE_TIMEOUT = "음성 채널 연결이 시간 초과됐어. 잠시 후 다시 시도해줘."
 
 # ==============================
 # ✅ yt-dlp 설정 (✅ 쿠키 미사용)  ← 처음 방식으로 복귀
 # ==============================
+# ✅ 단일곡 추출에 쓸 유튜브 player_client 목록(첫 번째가 기본, 나머지는 헤지/대체용)
+YTDLP_PLAYER_CLIENTS = [c.strip() for c in os.getenv("YTDLP_PLAYER_CLIENTS", "android,ios").split(",") if c.strip()] or ["android"]
+# ✅ 기본 client가 이 시간(초) 안에 답이 없으면 다른 client로 동시에 한 번 더 추출(0이면 끔)
+EXTRACT_HEDGE_DELAY_SEC = float(os.getenv("EXTRACT_HEDGE_DELAY_SEC", "3.0"))
+# ✅ client가 연속 N번 실패하면 COOLDOWN초 동안 뒤로 미룸(서킷 브레이커)
+CLIENT_BREAKER_FAILS = int(os.getenv("CLIENT_BREAKER_FAILS", "3"))
+CLIENT_BREAKER_COOLDOWN_SEC = float(os.getenv("CLIENT_BREAKER_COOLDOWN_SEC", "120"))
+
 YTDLP_OPTIONS_SINGLE = {
     "format": "bestaudio/best",
     "noplaylist": True,
@@ -67,10 +123,17 @@ YTDLP_OPTIONS_SINGLE = {
     },
     "remote_components": ["ejs:github"],
     "extractor_args": {
-        "youtube": {"player_client": ["android"]}
+        "youtube": {"player_client": [YTDLP_PLAYER_CLIENTS[0]]}
     },
 }
 
+def single_options_for_client(client: str) -> dict:
+    return {**YTDLP_OPTIONS_SINGLE, "extractor_args": {"youtube": {"player_client": [client]}}}
+
+def single_pool_name(client: str) -> str:
+    # 기본 client는 예전 이름("single") 그대로
+    return "single" if client == YTDLP_PLAYER_CLIENTS[0] else "single:" + client
+
 # ✅ 플레이리스트 "목록만" 뽑는 옵션(스트림 URL 추출은 재생 직전)
 YTDLP_OPTIONS_PLAYLIST_FLAT = {
     **YTDLP_OPTIONS_SINGLE,
@@ -79,6 +142,54 @@ YTDLP_OPTIONS_PLAYLIST_FLAT = {
     "skip_download": True,
 }
 
+# ✅ 옵션셋별로 미리 만들어 두고 재사용할 YoutubeDL 개수
+YTDLP_POOL_SIZE = int(os.getenv("YTDLP_POOL_SIZE", "4"))
+
+# ✅ 추출 실행 방식: "thread"(기본, 봇 프로세스 안 스레드) | "process"(별도 프로세스 풀)
+EXTRACT_BACKEND = os.getenv("EXTRACT_BACKEND", "thread")
+# process 방식일 때 워커 프로세스 수 / 워커 하나가 처리할 최대 작업 수(넘으면 새 프로세스로 교체)
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", "2"))
+EXTRACT_WORKER_MAX_JOBS = int(os.getenv("EXTRACT_WORKER_MAX_JOBS", "200"))
+# ✅ 봇 전체에서 동시에 돌릴 yt-dlp 추출 수(넘으면 우선순위/길드 순서대로 대기)
+EXTRACT_CONCURRENCY = int(os.getenv("EXTRACT_CONCURRENCY", "4"))
+# ✅ 낮은 우선순위 요청이 이 시간(초) 넘게 밀리면 한 번은 먼저 보내 줌(굶주림 방지)
+EXTRACT_STARVATION_SEC = float(os.getenv("EXTRACT_STARVATION_SEC", "10"))
+# ✅ 동시에 목록을 받을 플레이리스트 수(단일곡 추출 자리와 별도)
+PLAYLIST_CONCURRENCY = int(os.getenv("PLAYLIST_CONCURRENCY", "2"))
+
+# ==============================
+# ✅ 추출 결과 캐시 설정
+# ==============================
+TRACK_CACHE_SIZE = int(os.getenv("TRACK_CACHE_SIZE", "2000"))
+# 제목/길이/썸네일 재사용 기간(초)
+TRACK_CACHE_META_TTL_SEC = 6 * 60 * 60
+# expire= 가 없는 스트림 URL의 유효기간(초)
+STREAM_URL_DEFAULT_TTL_SEC = 60 * 60
+# 만료 직전 URL은 재생 도중 끊길 수 있어서 여유를 둠(초)
+STREAM_URL_EXPIRE_MARGIN_SEC = 10 * 60
+
+# ✅ 디스크 추출 캐시(SQLite, 재시작 후에도 유지). 경로를 빈 값으로 두면 끔
+RESOLVE_DB_PATH = os.getenv("RESOLVE_DB_PATH", "resolve_cache.sqlite3")
+RESOLVE_DB_MAX_ROWS = int(os.getenv("RESOLVE_DB_MAX_ROWS", "50000"))
+# 디스크에 저장된 메타 재사용 기간(초)
+RESOLVE_DB_META_TTL_SEC = 30 * 24 * 60 * 60
+# 모아 둔 쓰기를 디스크에 반영하는 주기(초)
+RESOLVE_DB_FLUSH_SEC = 5.0
+# 아직 유효한 스트림 URL도 같이 저장할지
+RESOLVE_DB_STORE_STREAM = os.getenv("RESOLVE_DB_STORE_STREAM", "1") != "0"
+
+# ==============================
+# ✅ 재시작 복원(길드별 대기열/재생 위치 스냅샷)
+# ==============================
+# 길드별 스냅샷 폴더. 빈 값으로 두면 저장/복원 모두 끔
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "snapshots")
+# 바뀐 길드만 모아서 쓰는 주기(초)
+SNAPSHOT_INTERVAL_SEC = float(os.getenv("SNAPSHOT_INTERVAL_SEC", "15"))
+# 이보다 오래된 스냅샷은 복원하지 않고 지움(초)
+SNAPSHOT_MAX_AGE_SEC = float(os.getenv("SNAPSHOT_MAX_AGE_SEC", str(6 * 60 * 60)))
+# 길드 복원 사이 간격(초). 재시작 직후 음성 연결/추출이 한꺼번에 몰리지 않게
+RESTORE_STAGGER_SEC = float(os.getenv("RESTORE_STAGGER_SEC", "2"))
+
 # ==============================
 # FFmpeg 설정 (원래 그대로)
 # ==============================
@@ -87,6 +198,233 @@ FFMPEG_OPTIONS = {
     "options": "-vn -ar 48000 -ac 2",
 }
 
+# ✅ 재생 방식: "opus"(기본, 가능하면 Opus 패킷 그대로 전달) | "pcm"(항상 PCM 디코딩 후 봇에서 인코딩)
+PLAYBACK_MODE = os.getenv("PLAYBACK_MODE", "opus")
+
+# ✅ Opus 출력용(FFmpegOpusAudio가 -ar/-ac/-c:a를 직접 붙임)
+FFMPEG_OPUS_OPTIONS = {
+    "before_options": FFMPEG_OPTIONS["before_options"],
+    "options": "-vn",
+}
+
+# ✅ 끊김 없는 곡 전환: 지금 곡이 GAPLESS_PRESPAWN_SEC 남으면 다음 곡 ffmpeg를 미리 띄워 두고 바로 이어 보냄
+PLAYBACK_GAPLESS = os.getenv("PLAYBACK_GAPLESS", "1") != "0"
+GAPLESS_PRESPAWN_SEC = float(os.getenv("GAPLESS_PRESPAWN_SEC", "5"))
+# 실제 1초 동안 재생 위치가 늘어나는 초(실제 재생은 1. 배속으로 흘리는 벤치만 바꿈)
+PLAYBACK_CLOCK_RATE = 1.0
+# ✅ 크로스페이드 길이(초, 0이면 끔). 두 곡을 섞어야 하므로 PCM 소스끼리만 적용(PLAYBACK_MODE=pcm)
+CROSSFADE_SEC = float(os.getenv("CROSSFADE_SEC", "0"))
+
+# ✅ 음성 작업 프로세스 수(0이면 지금처럼 봇 프로세스 안에서 ffmpeg/Opus 처리)
+# - 1 이상이면 ffmpeg 실행/ogg 분해/PCM 인코딩을 작업 프로세스가 맡고, 봇은 완성된 Opus 패킷만 음성으로 보냄
+# - 봇 쪽 소스는 항상 Opus라서 크로스페이드(PCM끼리만)는 적용 안 됨
+VOICE_WORKERS = int(os.getenv("VOICE_WORKERS", "0"))
+# "process"(기본) | "thread"(같은 프로토콜을 스레드로 돌리는 대역, 디스코드/프로세스 없이 확인용)
+VOICE_WORKER_MODE = os.getenv("VOICE_WORKER_MODE", "process")
+# 작업자가 소스를 여는 함수("모듈:함수", spec -> AudioSource). 비우면 ffmpeg. 로컬 대역 소스로 프로토콜 확인할 때 씀
+VOICE_WORKER_SOURCE = os.getenv("VOICE_WORKER_SOURCE", "")
+# 작업자가 미리 보내 둘 수 있는 패킷 수(1패킷 = 20ms). 봇이 읽은 만큼 다시 허락
+VOICE_WORKER_BUFFER_PACKETS = 250
+VOICE_WORKER_CREDIT_STEP = 50
+# 이 시간(초) 동안 패킷도 끝 알림도 없으면 끊긴 것으로 봄(작업자 멈춤 대비)
+VOICE_WORKER_STALL_SEC = 30.0
+
+# ✅ 유튜브 Opus 오디오 포맷(itag). 이 포맷이면 ffmpeg가 디코딩 없이 패킷만 옮김
+YOUTUBE_OPUS_ITAGS = {"249", "250", "251", "338", "774"}
+
+# ✅ 자주 트는 곡 로컬 오디오 캐시(디렉터리를 비워 두면 끔)
+AUDIO_CACHE_DIR = os.getenv("AUDIO_CACHE_DIR", "")
+# 이 횟수 이상 재생된 곡만 디스크에 저장
+AUDIO_CACHE_MIN_PLAYS = int(os.getenv("AUDIO_CACHE_MIN_PLAYS", "3"))
+AUDIO_CACHE_MAX_MB = int(os.getenv("AUDIO_CACHE_MAX_MB", "2048"))
+# 너무 긴 곡(믹스/라이브)은 저장 안 함(초)
+AUDIO_CACHE_MAX_TRACK_SEC = 20 * 60
+# 동시에 돌릴 변환 작업 수 / 재생 횟수를 기억할 곡 수
+AUDIO_CACHE_JOBS = 1
+AUDIO_CACHE_COUNT_TRACKED = 10000
+
+# ✅ 메트릭(Prometheus 텍스트) 로컬 HTTP 엔드포인트. 포트 0이면 끔
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+
+# ==============================
+# ✅ 메트릭 (카운터 / 히스토그램 / 게이지)
+# ==============================
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, v in items:
+            out.append(f"{self.name}{_fmt_labels(self.labels, key)} {v:g}")
+        return out
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        # 라벨값 -> [버킷별 개수..., +Inf 개수, 합계]
+        self._values: Dict[tuple, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labels)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            for i, b in enumerate(self.buckets):
+                if value <= b:
+                    row[i] += 1
+                    break
+            else:
+                row[len(self.buckets)] += 1
+            row[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - start, **labels)
+
+    def summary(self) -> List[Tuple[tuple, int, float, float]]:
+        """
+        출력: [(라벨값, 개수, 평균, p95 추정(버킷 상한)), ...]
+        """
+        out = []
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        for key, row in items:
+            count = int(sum(row[:-1]))
+            if not count:
+                continue
+            need = count * 0.95
+            acc = 0.0
+            p95 = float("inf")
+            for i, b in enumerate(self.buckets):
+                acc += row[i]
+                if acc >= need:
+                    p95 = b
+                    break
+            out.append((key, count, row[-1] / count, p95))
+        return out
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        for key, row in items:
+            acc = 0.0
+            for i, b in enumerate(self.buckets):
+                acc += row[i]
+                out.append(f"{self.name}_bucket{_fmt_labels(self.labels + ('le',), key + (f'{b:g}',))} {acc:g}")
+            acc += row[len(self.buckets)]
+            out.append(f"{self.name}_bucket{_fmt_labels(self.labels + ('le',), key + ('+Inf',))} {acc:g}")
+            out.append(f"{self.name}_sum{_fmt_labels(self.labels, key)} {row[-1]:g}")
+            out.append(f"{self.name}_count{_fmt_labels(self.labels, key)} {acc:g}")
+        return out
+
+
+class Gauge:
+    """
+    값을 들고 있지 않고 수집 시점에 collect()를 불러서 [(라벨값, 값), ...]을 받음
+    """
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...], collect: Callable[[], List[Tuple[tuple, float]]]):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.collect = collect
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge"]
+        try:
+            items = self.collect()
+        except Exception:
+            items = []
+        for key, v in items:
+            out.append(f"{self.name}{_fmt_labels(self.labels, tuple(str(x) for x in key))} {v:g}")
+        return out
+
+
+def _fmt_labels(names: Tuple[str, ...], values: tuple) -> str:
+    if not names:
+        return ""
+    parts = []
+    for n, v in zip(names, values):
+        v = str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{n}="{v}"')
+    return "{" + ",".join(parts) + "}"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: list = []
+
+    def counter(self, name: str, help_text: str, labels: Tuple[str, ...] = ()) -> Counter:
+        m = Counter(name, help_text, labels)
+        self._metrics.append(m)
+        return m
+
+    def histogram(self, name: str, help_text: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        m = Histogram(name, help_text, labels, buckets)
+        self._metrics.append(m)
+        return m
+
+    def gauge(self, name: str, help_text: str, labels: Tuple[str, ...], collect) -> Gauge:
+        m = Gauge(name, help_text, labels, collect)
+        self._metrics.append(m)
+        return m
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for m in self._metrics:
+            lines.extend(m.render())
+        return "\n".join(lines) + "\n"
+
+    def histograms(self) -> List[Histogram]:
+        return [m for m in self._metrics if isinstance(m, Histogram)]
+
+
+metrics = MetricsRegistry()
+M_EXTRACT_SECONDS = metrics.histogram("bot_extract_seconds", "yt-dlp extraction attempt duration", ("kind",))
+M_EXTRACT_ATTEMPTS = metrics.counter("bot_extract_attempts_total", "yt-dlp extraction attempts", ("kind", "result"))
+M_EXTRACT_RETRIES = metrics.counter("bot_extract_retries_total", "yt-dlp extraction retries after a failed attempt", ("kind",))
+M_TRACK_CACHE = metrics.counter("bot_track_cache_lookups_total", "resolved-track cache lookups", ("tier", "result"))
+M_VOICE_CONNECT_SECONDS = metrics.histogram("bot_voice_connect_seconds", "voice channel connect latency")
+M_VOICE_CONNECT_TIMEOUTS = metrics.counter("bot_voice_connect_timeouts_total", "voice channel connect timeouts")
+M_FIRST_AUDIO_SECONDS = metrics.histogram("bot_first_audio_seconds", "audio source spawn to first packet", ("source",))
+M_TRACK_GAP_SECONDS = metrics.histogram("bot_track_gap_seconds", "silence between the end of a track and the next first packet")
+M_PANEL_REST = metrics.counter("bot_panel_rest_calls_total", "panel REST calls", ("op",))
+M_PANEL_SKIPPED = metrics.counter("bot_panel_updates_skipped_total", "panel updates skipped because nothing changed")
+M_EXTRACT_QUEUE_WAIT = metrics.histogram(
+    "bot_extract_queue_wait_seconds", "time an extraction waited for a scheduler slot", ("pool", "priority")
+)
+M_EXTRACT_HEDGES = metrics.counter("bot_extract_hedges_total", "second-client extractions started", ("reason",))
+M_EXTRACT_CLIENT = metrics.counter("bot_extract_client_total", "single-track extractions per player client", ("client", "result"))
+M_MIDTRACK_RECOVERIES = metrics.counter("bot_midtrack_recoveries_total", "mid-track stream recoveries", ("result",))
+M_EXTRACT_COALESCED = metrics.counter("bot_extract_coalesced_total", "single-track lookups that joined an in-flight extraction")
+M_VOICE_WORKER_RESTARTS = metrics.counter("bot_voice_worker_restarts_total", "voice worker processes respawned after dying")
+M_GUILD_STATE = metrics.counter("bot_guild_state_events_total", "guild music state lifecycle events", ("event",))
+
 # ==============================
 # ✅ 공통: 빈 메시지 전송 방지 + 안전 응답
 # ==============================
@@ -124,53 +462,652 @@ async def safe_defer(interaction: discord.Interaction, *, thinking: bool = True)
 # ==============================
 # 데이터 구조
 # ==============================
-@dataclass
+# ✅ 유튜브 영상은 영상 ID만 저장하고 URL/썸네일은 필요할 때 만듦
+YT_WATCH_PREFIX = "https://www.youtube.com/watch?v="
+YT_THUMB_PREFIX = "https://i.ytimg.com/vi/"
+# 제목을 못 받았을 때 쓰는 자리표시(나중에 진짜 제목이 오면 바꿔 씀)
+UNKNOWN_TITLE = "Unknown Title"
+
+
+class TrackMeta:
+    """
+    곡 공통 정보(제목/영상 ID/길이/썸네일).
+    - 같은 영상은 프로세스 전체(모든 길드/대기열/반복)에서 객체 하나를 같이 씀(intern_track_meta)
+    - page: 유튜브 watch URL이면 None(video_id로 만듦), 아니면 원래 URL
+    - thumb: 유튜브 기본 썸네일이면 파일 이름만(예: "hqdefault.jpg"), 아니면 원래 URL
+    """
+    __slots__ = ("title", "video_id", "page", "duration", "thumb", "__weakref__")
+
+    def __init__(self, title: str, video_id: Optional[str], page: Optional[str]):
+        self.title = title
+        self.video_id = video_id
+        self.page = page
+        self.duration: Optional[int] = None
+        self.thumb: Optional[str] = None
+
+    @property
+    def url(self) -> str:
+        return self.page if self.page is not None else YT_WATCH_PREFIX + self.video_id
+
+    @property
+    def thumbnail(self) -> Optional[str]:
+        t = self.thumb
+        if t is None or t.startswith("http"):
+            return t
+        return f"{YT_THUMB_PREFIX}{self.video_id}/{t}"
+
+    def fill(self, duration: Optional[int], thumbnail: Optional[str]):
+        """출력: 비어 있는 길이/썸네일만 채움(같은 영상이라 값이 달라질 일이 없음)"""
+        if self.duration is None and duration is not None:
+            self.duration = duration
+        if self.thumb is None and thumbnail:
+            prefix = f"{YT_THUMB_PREFIX}{self.video_id}/" if self.video_id else None
+            name = thumbnail[len(prefix):] if prefix and thumbnail.startswith(prefix) else ""
+            self.thumb = sys.intern(name) if name and "/" not in name and "?" not in name else thumbnail
+
+
+# 영상 ID(유튜브가 아니면 URL) -> TrackMeta. 어느 대기열에서도 안 쓰면 자동으로 빠짐
+_track_meta_table: "weakref.WeakValueDictionary[str, TrackMeta]" = weakref.WeakValueDictionary()
+
+def intern_track_meta(title: str, url: str, duration: Optional[int] = None, thumbnail: Optional[str] = None) -> TrackMeta:
+    """
+    입력값: 제목, 영상 URL, 길이, 썸네일
+    출력값: 같은 영상이면 이미 있는 TrackMeta(비어 있던 길이/썸네일, 자리표시 제목은 채움), 없으면 새로 만듦
+    """
+    vid = youtube_video_id(url)
+    canonical = vid is not None and url == YT_WATCH_PREFIX + vid
+    key = vid if canonical else url
+    meta = _track_meta_table.get(key)
+    if meta is None:
+        meta = TrackMeta(title, vid, None if canonical else url)
+        _track_meta_table[key] = meta
+    elif title and title != UNKNOWN_TITLE and (not meta.title or meta.title == UNKNOWN_TITLE):
+        # ✅ 플리 목록(flat)에서 제목 없이 먼저 들어온 곡은 단일 추출 때 진짜 제목으로 바꿈
+        meta.title = title
+    meta.fill(duration, thumbnail)
+    return meta
+
+
 class Track:
-    title: str
-    url: str
-    stream_url: Optional[str]  # ✅ 지연 추출 때문에 Optional
-    requester: int
-    duration: Optional[int] = None
-    thumbnail: Optional[str] = None
+    """
+    대기열 한 칸. 곡 정보는 공유 TrackMeta를 가리키고, 칸마다 다른 것(요청자/스트림 URL)만 따로 가짐
+    - ==는 같은 곡 정보 + 같은 스트림 URL/요청자면 True(예전 dataclass와 같음, 해시 불가)
+    - pickle(추출 프로세스 풀)로 넘어오면 받는 쪽에서 다시 intern_track_meta를 거침
+    - stream_expire: stream_url을 받은 순간 한 번 정해 둔 만료 시각(expire= 가 없으면 그때부터 기본 유효기간)
+    """
+    __slots__ = ("meta", "_stream_url", "stream_expire", "requester")
+
+    def __init__(
+        self,
+        title: str,
+        url: str,
+        stream_url: Optional[str],  # ✅ 지연 추출 때문에 Optional
+        requester: int,
+        duration: Optional[int] = None,
+        thumbnail: Optional[str] = None,
+        meta: Optional[TrackMeta] = None,
+        stream_expire: Optional[float] = None,  # 캐시/스냅샷에 저장해 둔 만료 시각
+    ):
+        self.meta = meta or intern_track_meta(title, url, duration, thumbnail)
+        self.stream_url = stream_url
+        if stream_url and stream_expire is not None:
+            self.stream_expire = stream_expire
+        self.requester = requester
+
+    @property
+    def stream_url(self) -> Optional[str]:
+        return self._stream_url
+
+    @stream_url.setter
+    def stream_url(self, value: Optional[str]):
+        self._stream_url = value
+        self.stream_expire = stream_url_expire(value) if value else 0.0
+
+    def stream_usable(self) -> bool:
+        """출력값: 스트림 URL이 있고 만료까지 STREAM_URL_EXPIRE_MARGIN_SEC 넘게 남았으면 True"""
+        return bool(self._stream_url) and self.stream_expire - STREAM_URL_EXPIRE_MARGIN_SEC > time.time()
+
+    @property
+    def title(self) -> str:
+        return self.meta.title
+
+    @property
+    def url(self) -> str:
+        return self.meta.url
+
+    @property
+    def duration(self) -> Optional[int]:
+        return self.meta.duration
+
+    @duration.setter
+    def duration(self, value: Optional[int]):
+        self.meta.fill(value, None)
+
+    @property
+    def thumbnail(self) -> Optional[str]:
+        return self.meta.thumbnail
+
+    @thumbnail.setter
+    def thumbnail(self, value: Optional[str]):
+        self.meta.fill(None, value)
+
+    def copy_with(self, **changes) -> "Track":
+        """출력값: 곡 정보는 그대로 공유하고 stream_url/requester만 바꾼 새 칸"""
+        t = Track.__new__(Track)
+        t.meta = self.meta
+        if "stream_url" in changes:
+            t.stream_url = changes["stream_url"]
+            if t.stream_url and changes.get("stream_expire") is not None:
+                t.stream_expire = changes["stream_expire"]
+        else:
+            t._stream_url, t.stream_expire = self._stream_url, self.stream_expire
+        t.requester = changes.get("requester", self.requester)
+        return t
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Track):
+            return NotImplemented
+        return (
+            self.meta is other.meta
+            and self.stream_url == other.stream_url
+            and self.requester == other.requester
+        )
 
+    __hash__ = None
 
-class GuildMusic:
+    def __reduce__(self):
+        return (
+            Track,
+            (self.title, self.url, self.stream_url, self.requester, self.duration, self.thumbnail, None, self.stream_expire),
+        )
+
+    def __repr__(self) -> str:
+        return f"Track({self.title!r}, {self.url!r})"
+
+class _QueueNode:
+    __slots__ = ("track", "prio", "size", "left", "right")
+
+    def __init__(self, track: Track):
+        self.track = track
+        self.prio = random.random()
+        self.size = 1
+        self.left: Optional["_QueueNode"] = None
+        self.right: Optional["_QueueNode"] = None
+
+
+def _qsize(node: Optional[_QueueNode]) -> int:
+    return node.size if node is not None else 0
+
+def _qupdate(node: _QueueNode):
+    node.size = 1 + _qsize(node.left) + _qsize(node.right)
+
+def _qsplit(node: Optional[_QueueNode], k: int) -> Tuple[Optional[_QueueNode], Optional[_QueueNode]]:
+    # 앞 k개 / 나머지로 나눔
+    if node is None:
+        return None, None
+    left_size = _qsize(node.left)
+    if k <= left_size:
+        a, b = _qsplit(node.left, k)
+        node.left = b
+        _qupdate(node)
+        return a, node
+    a, b = _qsplit(node.right, k - left_size - 1)
+    node.right = a
+    _qupdate(node)
+    return node, b
+
+def _qmerge(a: Optional[_QueueNode], b: Optional[_QueueNode]) -> Optional[_QueueNode]:
+    if a is None:
+        return b
+    if b is None:
+        return a
+    if a.prio > b.prio:
+        a.right = _qmerge(a.right, b)
+        _qupdate(a)
+        return a
+    b.left = _qmerge(a, b.left)
+    _qupdate(b)
+    return b
+
+def _qbuild(tracks) -> Optional[_QueueNode]:
+    """
+    입력값: 곡 목록(순서 유지)
+    출력값: 트립 루트(스택으로 O(n) 구성)
+    """
+    stack: List[_QueueNode] = []
+    for t in tracks:
+        node = _QueueNode(t)
+        last = None
+        while stack and stack[-1].prio < node.prio:
+            last = stack.pop()
+        node.left = last
+        if stack:
+            stack[-1].right = node
+        stack.append(node)
+    if not stack:
+        return None
+
+    root = stack[0]
+    # 크기는 후위 순회로 한 번에 계산
+    order: List[_QueueNode] = []
+    todo = [root]
+    while todo:
+        n = todo.pop()
+        order.append(n)
+        if n.left is not None:
+            todo.append(n.left)
+        if n.right is not None:
+            todo.append(n.right)
+    for n in reversed(order):
+        _qupdate(n)
+    return root
+
+
+class TrackQueue:
+    """
+    GuildMusic.queue 전용 대기열(순서 인덱스 트립).
+    - 번호로 넣기/빼기/옮기기 O(log n), 앞에서부터 k개 보기 O(log n + k)
+    - append/appendleft/popleft 등 player_loop가 쓰는 deque 방식 그대로 지원
+    - 곡이 들어오면 wait_for_item()으로 기다리던 player_loop가 바로 깨어남(폴링 없음)
+    """
     def __init__(self):
-        self.queue: Deque[Track] = deque()
+        self._root: Optional[_QueueNode] = None
+        self._not_empty = asyncio.Event()
+        # 내용이 바뀔 때마다 1씩 증가(스냅샷이 바뀐 길드만 골라 쓰는 데 사용)
+        self.version = 0
+        # 내용이 바뀔 때마다 부르는 콜백(GuildMusic이 다음 곡 계획 변경 알림에 씀)
+        self.on_change: Optional[Callable[[], None]] = None
+
+    def _changed(self):
+        self.version += 1
+        if self.on_change is not None:
+            self.on_change()
+        if self._root is not None:
+            self._not_empty.set()
+        else:
+            self._not_empty.clear()
+
+    def _index(self, index: int) -> int:
+        n = _qsize(self._root)
+        if index < 0:
+            index += n
+        if not 0 <= index < n:
+            raise IndexError("대기열 번호 범위를 벗어남")
+        return index
+
+    def insert(self, index: int, track: Track):
+        n = _qsize(self._root)
+        index = max(0, min(n, index if index >= 0 else index + n))
+        a, b = _qsplit(self._root, index)
+        self._root = _qmerge(_qmerge(a, _QueueNode(track)), b)
+        self._changed()
+
+    def append(self, track: Track):
+        self._root = _qmerge(self._root, _QueueNode(track))
+        self._changed()
+
+    def appendleft(self, track: Track):
+        self._root = _qmerge(_QueueNode(track), self._root)
+        self._changed()
+
+    def extend(self, tracks):
+        self._root = _qmerge(self._root, _qbuild(tracks))
+        self._changed()
+
+    def remove_at(self, index: int) -> Track:
+        index = self._index(index)
+        a, b = _qsplit(self._root, index)
+        mid, b = _qsplit(b, 1)
+        self._root = _qmerge(a, b)
+        self._changed()
+        return mid.track
+
+    def popleft(self) -> Track:
+        if self._root is None:
+            raise IndexError("빈 대기열")
+        return self.remove_at(0)
+
+    def move(self, src: int, dst: int):
+        """
+        입력값: src(옮길 곡 번호, 0부터), dst(옮긴 뒤 번호)
+        """
+        track = self.remove_at(src)
+        self.insert(dst, track)
+
+    def shuffle(self):
+        items = list(self)
+        random.shuffle(items)
+        self._root = _qbuild(items)
+        self._changed()
+
+    def clear(self):
+        self._root = None
+        self._changed()
+
+    def slice(self, start: int, stop: int) -> List[Track]:
+        """
+        출력: start~stop-1 번 곡 목록(목록/패널용, 전체 복사 없음)
+        """
+        n = _qsize(self._root)
+        start = max(0, start)
+        stop = min(n, stop)
+        out: List[Track] = []
+        if start >= stop:
+            return out
+
+        # start 번째 노드까지 내려가며 스택을 쌓고, 거기서부터 중위 순회
+        stack: List[_QueueNode] = []
+        node = self._root
+        k = start
+        while node is not None:
+            left_size = _qsize(node.left)
+            if k < left_size:
+                stack.append(node)
+                node = node.left
+            elif k == left_size:
+                stack.append(node)
+                break
+            else:
+                k -= left_size + 1
+                node = node.right
+
+        while stack and len(out) < stop - start:
+            node = stack.pop()
+            out.append(node.track)
+            child = node.right
+            while child is not None:
+                stack.append(child)
+                child = child.left
+        return out
+
+    async def wait_for_item(self):
+        await self._not_empty.wait()
+
+    def __len__(self) -> int:
+        return _qsize(self._root)
+
+    def __bool__(self) -> bool:
+        return self._root is not None
+
+    def __iter__(self):
+        stack: List[_QueueNode] = []
+        node = self._root
+        while stack or node is not None:
+            while node is not None:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            yield node.track
+            node = node.right
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            items = self.slice(start, stop)
+            return items[::step] if step != 1 else items
+
+        index = self._index(index)
+        node = self._root
+        while True:
+            left_size = _qsize(node.left)
+            if index < left_size:
+                node = node.left
+            elif index == left_size:
+                return node.track
+            else:
+                index -= left_size + 1
+                node = node.right
+
+
+# 패널/목록에 보여 주는 대기열 앞부분 길이
+VIEW_HEAD = 20
+
+
+@dataclass(frozen=True)
+class MusicView:
+    """
+    패널/목록이 읽는 읽기 전용 스냅샷. 만든 뒤 상태가 바뀌어도 그대로라서 await를 사이에 둬도 일관됨
+    """
+    now_playing: Optional[Track]
+    upcoming: Tuple[Track, ...]
+    queue_len: int
+    repeat_mode: str
+    busy: bool
+    loading: bool
+
+
+class GuildMusic:
+    """
+    길드 하나의 재생 상태(길드별 액터).
+    - 상태를 바꾸는 코드는 전부 await 없이 한 번에 끝나는 구간으로만 씀
+      -> 이벤트 루프가 명령을 하나씩 끝까지 처리하는 우편함 역할을 해서 락이 필요 없음
+    - 상태 바꾸는 구간 안에 await를 넣지 말 것(넣어야 하면 그 전에 필요한 값을 다 꺼내 두기)
+    - 읽기만 하는 쪽(패널/목록)은 view() 스냅샷을 씀
+    """
+    def __init__(self, guild_id: int):
+        self.guild_id = guild_id
+        # ✅ 대기열/반복 모드가 바뀌면 세워짐(미리 띄워 둔 다음 곡을 다시 고를 때 폴링 대신 기다림)
+        self.plan_changed = asyncio.Event()
+        self.queue: TrackQueue = TrackQueue()
+        self.queue.on_change = self.plan_changed.set
         self.now_playing: Optional[Track] = None
 
-        self.lock = asyncio.Lock()
         self.next_event = asyncio.Event()
         self.player_task: Optional[asyncio.Task] = None
+        # 직전 곡이 끝난 시각(다음 곡 첫 패킷까지의 공백 측정용, 대기열이 비면 None)
+        self.track_end_ts: Optional[float] = None
 
         self.last_command_ts: float = time.monotonic()
-        self.idle_task: Optional[asyncio.Task] = None
 
         # 패널
         self.panel_channel_id: Optional[int] = None
         self.panel_message_id: Optional[int] = None
+        self.panel: PanelRenderer = PanelRenderer()
 
         # 반복 모드
-        self.repeat_mode: str = "off"  # "off" | "all" | "one"
+        self._repeat_mode: str = "off"  # "off" | "all" | "one"
 
         # 스킵 플래그(스킵 종료는 repeat에 재삽입 안 함)
         self.skip_flag: bool = False
 
-        # ✅ 플레이리스트 처리 중 잠금 + 취소용 태스크 핸들
+        # ✅ 플레이리스트 처리 중 표시 + 취소용 태스크 핸들(둘 다 await 없이 확인/설정)
         self.is_busy: bool = False
-        self.busy_lock: asyncio.Lock = asyncio.Lock()
         self.playlist_task: Optional[asyncio.Task] = None
 
+        # ✅ 다음 곡 미리 추출 작업(id(track) -> 태스크)
+        self.prefetch_jobs: Dict[int, asyncio.Task] = {}
+
+        # ✅ 재생 위치(스냅샷용): 지금 소스 + 이어 재생 시작 위치
+        self.play_source: Optional["TrackedSource"] = None
+        self.play_offset: float = 0.0
+        # ✅ 재시작 복원: 이 곡을 재생할 때 이 위치(초)부터
+        self.restore_offset: Optional[Tuple[Track, float]] = None
+        # 마지막으로 쓴 스냅샷의 변경 키 / 마지막으로 쓴 대기열 파일의 TrackQueue.version
+        self.snapshot_key: Optional[tuple] = None
+        self.snapshot_queue_version: Optional[int] = None
+
+        # 마지막으로 만든 view()와 그때 상태 키
+        self._view: Optional[MusicView] = None
+        self._view_key: Optional[tuple] = None
+
+    def view(self) -> MusicView:
+        """
+        출력값: 지금 상태의 MusicView(상태가 그대로면 같은 객체를 재사용)
+        """
+        key = (self.queue.version, id(self.now_playing), self.repeat_mode, self.is_busy, self.playlist_task is not None)
+        if key != self._view_key:
+            self._view = MusicView(
+                now_playing=self.now_playing,
+                upcoming=tuple(self.queue[:VIEW_HEAD]),
+                queue_len=len(self.queue),
+                repeat_mode=self.repeat_mode,
+                busy=self.is_busy,
+                loading=self.playlist_task is not None,
+            )
+            self._view_key = key
+        return self._view
+
+    @property
+    def repeat_mode(self) -> str:
+        return self._repeat_mode
+
+    @repeat_mode.setter
+    def repeat_mode(self, value: str):
+        self._repeat_mode = value
+        self.plan_changed.set()
+
+    def position_sec(self) -> float:
+        if self.play_source is None:
+            return 0.0
+        return self.play_offset + self.play_source.position_sec
+
+
+class TimerWheel:
+    """
+    해시 타이머 휠(1칸 = tick_sec초).
+    - arm/cancel은 O(1): 키 -> 칸 위치를 기억해 두고 옮기기만 함
+    - 태스크 하나가 틱마다 현재 칸만 확인해서 기한이 지난 키의 콜백을 실행
+    - 걸린 타이머가 없으면 틱 태스크도 잠듦(깨어나지 않음)
+    """
+    def __init__(self, callback: Callable[[int], Awaitable[None]], tick_sec: float = 1.0, slots: int = 512):
+        self.callback = callback
+        self.tick_sec = tick_sec
+        self._slots: List[set] = [set() for _ in range(slots)]
+        self._slot_of: Dict[int, int] = {}
+        self._deadline_tick: Dict[int, int] = {}
+        self._origin = time.monotonic()
+        self._done_tick = self._now_tick()
+        self._has_timers = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        # 실행 중인 콜백 태스크(참조를 안 잡아 두면 도중에 GC될 수 있음)
+        self._firing: set = set()
+
+    def _now_tick(self) -> int:
+        return int((time.monotonic() - self._origin) / self.tick_sec)
+
+    def arm(self, key: int, delay_sec: float):
+        """
+        입력값: key(길드 ID), delay_sec
+        출력: 기존 타이머가 있으면 새 기한으로 옮김
+        """
+        self.cancel(key)
+        tick = max(self._now_tick(), self._done_tick) + max(1, int(delay_sec / self.tick_sec + 0.999))
+        slot = tick % len(self._slots)
+        self._slots[slot].add(key)
+        self._slot_of[key] = slot
+        self._deadline_tick[key] = tick
+        self._has_timers.set()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def cancel(self, key: int):
+        slot = self._slot_of.pop(key, None)
+        if slot is not None:
+            self._slots[slot].discard(key)
+            del self._deadline_tick[key]
+
+    def pending(self) -> int:
+        return len(self._deadline_tick)
+
+    async def _run(self):
+        while True:
+            if not self._deadline_tick:
+                self._has_timers.clear()
+                await self._has_timers.wait()
+                # 오래 잠들었던 구간은 비어 있었으므로 건너뜀
+                self._done_tick = max(self._done_tick, self._now_tick() - 1)
+
+            await asyncio.sleep(self.tick_sec)
+            now_tick = self._now_tick()
+            while self._done_tick < now_tick:
+                self._done_tick += 1
+                bucket = self._slots[self._done_tick % len(self._slots)]
+                due = [k for k in bucket if self._deadline_tick[k] <= self._done_tick]
+                for key in due:
+                    self.cancel(key)
+                    task = asyncio.create_task(self._fire(key))
+                    self._firing.add(task)
+                    task.add_done_callback(self._firing.discard)
+
+    async def _fire(self, key: int):
+        try:
+            await self.callback(key)
+        except Exception as e:
+            print("타이머 콜백 에러:", repr(e), flush=True)
+
+
+# ✅ 유휴 퇴장 타이머(길드 전체가 틱 태스크 하나를 공유)
+idle_timers = TimerWheel(lambda guild_id: on_idle_deadline(guild_id))
 
 music_data: Dict[int, GuildMusic] = {}
+# ✅ 내린 길드 ID, 그리고 다시 만들 때 이어받을 설정(기본값 "off"가 아닌 반복 모드만)
+evicted_guilds: set = set()
+guild_prefs: Dict[int, str] = {}
 
 def get_music(guild_id: int) -> GuildMusic:
-    if guild_id not in music_data:
-        music_data[guild_id] = GuildMusic()
-    return music_data[guild_id]
+    music = music_data.get(guild_id)
+    if music is None:
+        music = music_data[guild_id] = GuildMusic(guild_id)
+        music.repeat_mode = guild_prefs.get(guild_id, "off")
+        if guild_id in evicted_guilds:
+            evicted_guilds.discard(guild_id)
+            M_GUILD_STATE.inc(event="rehydrated")
+        else:
+            M_GUILD_STATE.inc(event="created")
+    return music
+
+def music_evictable(music: GuildMusic) -> bool:
+    """
+    출력값: 재생/대기열/진행 중 작업이 하나도 없고 GUILD_STATE_TTL_SEC 동안 명령이 없었으면 True
+    - 명령 처리 도중(get_music 후 await 중)인 상태를 내리지 않도록 마지막 명령 시각도 봄
+    """
+    guild = bot.get_guild(music.guild_id)
+    vc = guild.voice_client if guild else None
+    if vc is not None and vc.is_connected():
+        return False
+    if music.now_playing is not None or music.queue or music.is_busy or music.panel.active():
+        return False
+    for task in (music.player_task, music.playlist_task, *music.prefetch_jobs.values()):
+        if task is not None and not task.done():
+            return False
+    return time.monotonic() - music.last_command_ts >= GUILD_STATE_TTL_SEC
+
+async def on_evict_deadline(guild_id: int):
+    """
+    출력: 쉬고 있는 길드 상태를 music_data에서 뺌(반복 모드만 guild_prefs에 남김)
+    - 그 사이 다시 쓰이기 시작했으면 그대로 둠(끝나면 유휴 감시/퇴장에서 다시 걸림)
+    """
+    music = music_data.get(guild_id)
+    if music is None or not music_evictable(music):
+        return
+    del music_data[guild_id]
+    idle_timers.cancel(guild_id)
+    if music.repeat_mode != "off":
+        guild_prefs[guild_id] = music.repeat_mode
+    else:
+        guild_prefs.pop(guild_id, None)
+    evicted_guilds.add(guild_id)
+    M_GUILD_STATE.inc(event="evicted")
+
+# ✅ 길드 상태 정리 타이머(유휴 퇴장과 같은 타이머 휠 방식)
+evict_timers = TimerWheel(lambda guild_id: on_evict_deadline(guild_id), tick_sec=5.0)
+
+def schedule_evict(music: GuildMusic):
+    evict_timers.arm(music.guild_id, GUILD_STATE_TTL_SEC)
+
+metrics.gauge(
+    "bot_queue_depth", "queued tracks per guild", ("guild",),
+    lambda: [((gid,), len(m.queue)) for gid, m in list(music_data.items())],
+)
+metrics.gauge("bot_idle_timers_pending", "armed idle-leave timers", (), lambda: [((), idle_timers.pending())])
+metrics.gauge(
+    "bot_guild_states", "guild music states held in memory vs evicted", ("state",),
+    lambda: [(("live",), len(music_data)), (("evicted",), len(evicted_guilds))],
+)
 
 def touch_command(music: GuildMusic):
     music.last_command_ts = time.monotonic()
+    idle_timers.arm(music.guild_id, IDLE_TIMEOUT_SEC)
 
 def fmt_time(sec: Optional[int]) -> str:
     if sec is None:
@@ -195,11 +1132,7 @@ def repeat_button_style(mode: str) -> discord.ButtonStyle:
     return discord.ButtonStyle.secondary
 
 def shuffle_queue_inplace(music: GuildMusic):
-    import random
-    q = list(music.queue)
-    random.shuffle(q)
-    music.queue.clear()
-    music.queue.extend(q)
+    music.queue.shuffle()
 
 # ==============================
 # ✅ 플레이리스트 자동 인식
@@ -214,18 +1147,428 @@ def is_youtube_playlist_input(q: str) -> bool:
         return True
     return False
 
-def extract_single_track(query: str) -> Track:
+# ==============================
+# ✅ yt-dlp 추출기 풀 (옵션셋별 YoutubeDL 재사용)
+# ==============================
+class YtdlPool:
+    """
+    옵션셋 이름별로 만들어 둔 YoutubeDL을 빌려주고 돌려받음.
+    - 빌려간 동안은 한 스레드만 사용(YoutubeDL은 스레드 안전하지 않음)
+    - 추출 중 예외가 나면 그 인스턴스는 버리고 다음에 새로 만듦
+    """
+    def __init__(self, size: int):
+        self.size = max(1, size)
+        self._options: Dict[str, dict] = {}
+        self._idle: Dict[str, List[yt_dlp.YoutubeDL]] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, options: dict):
+        self._options[name] = options
+        self._idle.setdefault(name, [])
+
+    def _create(self, name: str) -> yt_dlp.YoutubeDL:
+        # YoutubeDL이 옵션 dict를 건드릴 수 있어서 복사본으로 생성
+        ydl = yt_dlp.YoutubeDL(copy.deepcopy(self._options[name]))
+        # 추출기 인스턴스는 첫 사용 때 만들어지므로 미리 만들어 둠(플레이어 JS 캐시도 여기 붙음)
+        ydl.get_info_extractor("Youtube")
+        ydl.get_info_extractor("YoutubeTab")
+        return ydl
+
+    def _discard(self, ydl: yt_dlp.YoutubeDL):
+        try:
+            ydl.close()
+        except Exception:
+            pass
+
+    def warm(self):
+        """
+        출력: 옵션셋마다 size개까지 미리 생성(부팅 직후 스레드에서 호출)
+        """
+        for name in list(self._options):
+            while True:
+                with self._lock:
+                    if len(self._idle[name]) >= self.size:
+                        break
+                ydl = self._create(name)
+                with self._lock:
+                    self._idle[name].append(ydl)
+
+    @contextmanager
+    def lease(self, name: str):
+        with self._lock:
+            idle = self._idle[name]
+            ydl = idle.pop() if idle else None
+        if ydl is None:
+            ydl = self._create(name)
+
+        ok = False
+        try:
+            yield ydl
+            ok = True
+        finally:
+            if ok:
+                with self._lock:
+                    if len(self._idle[name]) < self.size:
+                        self._idle[name].append(ydl)
+                        ydl = None
+            if ydl is not None:
+                self._discard(ydl)
+
+    def idle_count(self, name: str) -> int:
+        with self._lock:
+            return len(self._idle.get(name, []))
+
+
+ytdl_pool = YtdlPool(YTDLP_POOL_SIZE)
+ytdl_pool.register("single", YTDLP_OPTIONS_SINGLE)
+for _client in YTDLP_PLAYER_CLIENTS[1:]:
+    ytdl_pool.register(single_pool_name(_client), single_options_for_client(_client))
+ytdl_pool.register("playlist_flat", YTDLP_OPTIONS_PLAYLIST_FLAT)
+
+# ==============================
+# ✅ 추출 결과 캐시 (검색어/영상 ID -> 메타 + 스트림 URL)
+# ==============================
+_YT_VIDEO_ID_RE = re.compile(r"(?:[?&]v=|youtu\.be/|/shorts/|/embed/|/live/)([A-Za-z0-9_-]{11})")
+_STREAM_EXPIRE_RE = re.compile(r"[?&/]expire[=/](\d+)")
+
+def youtube_video_id(s: str) -> Optional[str]:
+    m = _YT_VIDEO_ID_RE.search(s or "")
+    return m.group(1) if m else None
+
+def normalize_query(query: str) -> str:
+    """
+    입력값: query(URL 또는 검색어)
+    출력값: 캐시 키(영상 URL이면 "id:<영상ID>", 검색어면 공백/대소문자 정리한 "q:<검색어>")
+    - 스킴 없는 URL(youtu.be/..., www.youtube.com/watch?v=...)도 공백 없는 한 덩어리면 URL로 봄
+    """
+    s = query.strip()
+    vid = youtube_video_id(s) if s and not any(c.isspace() for c in s) else None
+    if vid:
+        return "id:" + vid
+    return "q:" + " ".join(s.lower().split())
+
+def stream_url_expire(stream_url: str) -> float:
+    """
+    입력값: googlevideo 스트림 URL(방금 받은 것)
+    출력값: 만료 시각(unix time). expire= 가 없으면 지금부터 기본 유효기간 적용
+    - 받은 순간 한 번만 불러서 저장해 둘 것(Track.stream_expire, CachedTrack.stream_expire)
+    """
+    m = _STREAM_EXPIRE_RE.search(stream_url or "")
+    if m:
+        return float(m.group(1))
+    return time.time() + STREAM_URL_DEFAULT_TTL_SEC
+
+@dataclass
+class CachedTrack:
+    title: str
+    url: str
+    duration: Optional[int]
+    thumbnail: Optional[str]
+    stream_url: Optional[str]
+    stream_expire: float
+    meta_ts: float
+
+    def stream_valid(self) -> bool:
+        return bool(self.stream_url) and self.stream_expire - STREAM_URL_EXPIRE_MARGIN_SEC > time.time()
+
+    def to_track(self, requester: int = 0) -> Track:
+        return Track(
+            title=self.title,
+            url=self.url,
+            stream_url=self.stream_url if self.stream_valid() else None,
+            requester=requester,
+            duration=self.duration,
+            thumbnail=self.thumbnail,
+            stream_expire=self.stream_expire,
+        )
+
+
+class TrackCache:
+    """
+    LRU 캐시.
+    - 항목 키: "id:<영상ID>" (ID를 못 뽑으면 "url:<webpage_url>")
+    - 검색어 키("q:...")는 항목 키를 가리키는 별칭
+    - 메타는 TRACK_CACHE_META_TTL_SEC 동안 재사용, 스트림 URL은 expire= 기준으로 따로 만료
+    """
+    def __init__(self, max_entries: int, meta_ttl: float):
+        self.max_entries = max(1, max_entries)
+        self.meta_ttl = meta_ttl
+        self._entries: "OrderedDict[str, CachedTrack]" = OrderedDict()
+        self._aliases: "OrderedDict[str, str]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _entry_key(url: str) -> str:
+        vid = youtube_video_id(url)
+        return ("id:" + vid) if vid else ("url:" + url)
+
+    def _resolve_key(self, query: str) -> Optional[str]:
+        key = normalize_query(query)
+        if key in self._entries:
+            return key
+        target = self._aliases.get(key)
+        if target:
+            self._aliases.move_to_end(key)
+        return target
+
+    def flight_key(self, query: str) -> str:
+        """
+        입력값: query
+        출력값: 동시 추출 묶음 키. 영상 ID를 알면(URL이거나 이미 풀어 본 검색어) "id:<영상ID>", 모르면 normalize_query 결과
+        """
+        return self._resolve_key(query) or normalize_query(query)
+
+    def get(self, query: str) -> Optional[CachedTrack]:
+        key = self._resolve_key(query)
+        entry = self._entries.get(key) if key else None
+        if entry and time.time() - entry.meta_ts > self.meta_ttl:
+            del self._entries[key]
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, query: str, track: Track) -> Tuple[str, CachedTrack]:
+        entry = CachedTrack(
+            title=track.title,
+            url=track.url,
+            duration=track.duration,
+            thumbnail=track.thumbnail,
+            stream_url=track.stream_url,
+            stream_expire=track.stream_expire if track.stream_url else 0.0,
+            meta_ts=time.time(),
+        )
+        key = self._entry_key(track.url)
+        self.put_entry(query, key, entry)
+        return key, entry
+
+    def put_entry(self, query: str, key: str, entry: CachedTrack):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+
+        alias = normalize_query(query)
+        if alias != key:
+            self._aliases[alias] = key
+            self._aliases.move_to_end(alias)
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        while len(self._aliases) > self.max_entries:
+            self._aliases.popitem(last=False)
+
+    def update_stream(self, url: str, track: Track) -> Optional[Tuple[str, CachedTrack]]:
+        """
+        입력값: url(항목의 영상 URL = CachedTrack.url), track(새로 추출한 곡)
+        출력값: (항목 키, 항목). 그사이 항목이 밀려났으면 None
+        - 항목 키는 put과 같은 방식(_entry_key)으로 찾으므로 유튜브가 아닌 "url:" 항목도 갱신됨
+        """
+        key = self._entry_key(url)
+        entry = self._entries.get(key)
+        if not entry:
+            print(f"[추출 캐시] 스트림 URL 갱신 건너뜀(항목 없음): {key}", flush=True)
+            return None
+        entry.stream_url = track.stream_url
+        entry.stream_expire = track.stream_expire
+        return key, entry
+
+    def invalidate_stream(self, query: str):
+        key = self._resolve_key(query)
+        entry = self._entries.get(key) if key else None
+        if entry:
+            entry.stream_url = None
+            entry.stream_expire = 0.0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+track_cache = TrackCache(TRACK_CACHE_SIZE, TRACK_CACHE_META_TTL_SEC)
+metrics.gauge("bot_track_cache_entries", "in-memory resolved-track cache entries", (), lambda: [((), len(track_cache))])
+
+# ==============================
+# ✅ 디스크 추출 캐시 (SQLite)
+# ==============================
+class ResolutionStore:
+    """
+    검색어/URL -> 영상 ID/제목/길이/썸네일(+유효한 스트림 URL)을 SQLite에 보관.
+    - 쓰기는 메모리에 모았다가 flush()에서 한 번에 반영(flush는 스레드에서 호출)
+    - 행 수가 max_rows를 넘으면 last_used가 오래된 것부터 삭제
+    """
+    def __init__(self, path: str, max_rows: int):
+        self.path = path
+        self.max_rows = max(1, max_rows)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db_lock = threading.Lock()
+        self._pending_lock = threading.Lock()
+        self._pending_tracks: Dict[str, tuple] = {}
+        self._pending_aliases: Dict[str, tuple] = {}
+
+        with self._db_lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS tracks ("
+                " key TEXT PRIMARY KEY,"
+                " title TEXT NOT NULL,"
+                " url TEXT NOT NULL,"
+                " duration INTEGER,"
+                " thumbnail TEXT,"
+                " stream_url TEXT,"
+                " stream_expire REAL NOT NULL DEFAULT 0,"
+                " meta_ts REAL NOT NULL,"
+                " last_used REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS tracks_last_used ON tracks(last_used)")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS aliases ("
+                " query TEXT PRIMARY KEY,"
+                " key TEXT NOT NULL,"
+                " last_used REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS aliases_last_used ON aliases(last_used)")
+
+    def lookup(self, query: str, *, with_stream: bool = True) -> Optional[Tuple[str, CachedTrack]]:
+        """
+        입력값: query, with_stream(False면 저장된 스트림 URL은 무시)
+        출력값: (항목 키, CachedTrack) 또는 None
+        """
+        key = normalize_query(query)
+        now = time.time()
+        with self._db_lock:
+            if key.startswith("q:"):
+                row = self._db.execute("SELECT key FROM aliases WHERE query = ?", (key,)).fetchone()
+                if not row:
+                    return None
+                key = row[0]
+            row = self._db.execute(
+                "SELECT title, url, duration, thumbnail, stream_url, stream_expire, meta_ts"
+                " FROM tracks WHERE key = ?",
+                (key,),
+            ).fetchone()
+        if not row or now - row[6] > RESOLVE_DB_META_TTL_SEC:
+            return None
+
+        title, url, duration, thumbnail, stream_url, stream_expire, _ = row
+        entry = CachedTrack(
+            title=title,
+            url=url,
+            duration=duration,
+            thumbnail=thumbnail,
+            stream_url=stream_url if with_stream else None,
+            stream_expire=stream_expire if with_stream else 0.0,
+            meta_ts=now,
+        )
+        if not entry.stream_valid():
+            entry.stream_url = None
+            entry.stream_expire = 0.0
+
+        # last_used 갱신도 다음 flush에 같이 반영
+        self.enqueue(query, key, entry)
+        return key, entry
+
+    def enqueue(self, query: str, key: str, entry: CachedTrack):
+        now = time.time()
+        keep_stream = RESOLVE_DB_STORE_STREAM and entry.stream_valid()
+        with self._pending_lock:
+            self._pending_tracks[key] = (
+                key,
+                entry.title,
+                entry.url,
+                entry.duration,
+                entry.thumbnail,
+                entry.stream_url if keep_stream else None,
+                entry.stream_expire if keep_stream else 0.0,
+                entry.meta_ts,
+                now,
+            )
+            alias = normalize_query(query)
+            if alias != key:
+                self._pending_aliases[alias] = (alias, key, now)
+
+    def flush(self):
+        with self._pending_lock:
+            tracks = list(self._pending_tracks.values())
+            aliases = list(self._pending_aliases.values())
+            self._pending_tracks.clear()
+            self._pending_aliases.clear()
+        if not tracks and not aliases:
+            return
+
+        with self._db_lock, self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO tracks"
+                " (key, title, url, duration, thumbnail, stream_url, stream_expire, meta_ts, last_used)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                tracks,
+            )
+            self._db.executemany(
+                "INSERT OR REPLACE INTO aliases (query, key, last_used) VALUES (?, ?, ?)",
+                aliases,
+            )
+            self._evict_locked("tracks", "key")
+            self._evict_locked("aliases", "query")
+
+    def _evict_locked(self, table: str, pk: str):
+        (count,) = self._db.execute(f"SELECT COUNT(*) FROM {table}").fetchone()
+        over = count - self.max_rows
+        if over > 0:
+            self._db.execute(
+                f"DELETE FROM {table} WHERE {pk} IN"
+                f" (SELECT {pk} FROM {table} ORDER BY last_used LIMIT ?)",
+                (over,),
+            )
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            with self._db_lock:
+                self._db.close()
+
+
+# ✅ import 시점에는 열지 않음(추출 워커 프로세스도 이 파일을 import함) -> on_ready에서 open_resolve_store()
+resolve_store: Optional[ResolutionStore] = None
+
+def open_resolve_store() -> Optional[ResolutionStore]:
+    """
+    입력값: 없음
+    출력값: 열린 ResolutionStore(끄거나 열기 실패면 None)
+    - 최초 1회만 SQLite를 열고 스키마 생성, 종료 시 close(남은 쓰기 flush) 등록
+    """
+    global resolve_store
+    if resolve_store is None and RESOLVE_DB_PATH:
+        try:
+            resolve_store = ResolutionStore(RESOLVE_DB_PATH, RESOLVE_DB_MAX_ROWS)
+            atexit.register(resolve_store.close)
+        except Exception as e:
+            print("디스크 추출 캐시 열기 실패(끄고 진행):", repr(e), flush=True)
+            resolve_store = None
+    return resolve_store
+
+async def resolve_store_flusher():
+    while True:
+        await asyncio.sleep(RESOLVE_DB_FLUSH_SEC)
+        try:
+            await asyncio.to_thread(resolve_store.flush)
+        except Exception as e:
+            print("디스크 추출 캐시 저장 실패:", repr(e), flush=True)
+
+def extract_single_track(query: str, client: Optional[str] = None) -> Track:
     """
-    입력값: query(유튜브 URL 또는 검색어)
+    입력값: query(유튜브 URL 또는 검색어), client(유튜브 player_client, 없으면 기본)
     출력값: Track(단일곡, stream_url 포함)
     """
-    with yt_dlp.YoutubeDL(YTDLP_OPTIONS_SINGLE) as ydl:
+    with ytdl_pool.lease(single_pool_name(client or YTDLP_PLAYER_CLIENTS[0])) as ydl:
         info = ydl.extract_info(query, download=False)
 
     if "entries" in info and info["entries"]:
         info = info["entries"][0]
 
-    title = info.get("title", "Unknown Title")
+    title = info.get("title") or UNKNOWN_TITLE
     webpage_url = info.get("webpage_url", query)
 
     stream_url = info.get("url")
@@ -241,59 +1584,649 @@ def extract_single_track(query: str) -> Track:
         thumbnail=info.get("thumbnail"),
     )
 
+def _flat_entry_pair(e) -> Optional[Tuple[str, str]]:
+    if not e:
+        return None
+
+    title = e.get("title") or UNKNOWN_TITLE
+
+    u = e.get("url") or e.get("webpage_url") or ""
+    if u and not u.startswith("http"):
+        u = "https://www.youtube.com/watch?v=" + u
+    if not u:
+        return None
+    return (title, u)
+
+def pump_playlist_flat(
+    playlist_url: str,
+    limit: int,
+    emit: Callable[[Tuple[str, str]], None],
+    *,
+    skip: int = 0,
+    stop: Optional[threading.Event] = None,
+) -> int:
+    """
+    입력값: playlist_url, limit, emit(곡 하나씩 받는 콜백), skip(앞에서 건너뛸 곡 수), stop(중단 신호)
+    출력값: emit한 곡 수
+    - process=False로 받아서 yt-dlp가 페이지를 넘기는 대로 곡을 넘김(전체 목록을 기다리지 않음)
+    """
+    sent = 0
+    seen = 0
+    with ytdl_pool.lease("playlist_flat") as ydl:
+        info = ydl.extract_info(playlist_url, download=False, process=False)
+
+        # watch?v=...&list=... 는 플레이리스트 URL 결과로 한두 번 넘어감
+        for _ in range(3):
+            if info.get("_type") in ("url", "url_transparent") and info.get("url"):
+                info = ydl.extract_info(info["url"], download=False, process=False, ie_key=info.get("ie_key"))
+            else:
+                break
+
+        for e in info.get("entries") or []:
+            if stop is not None and stop.is_set():
+                break
+            pair = _flat_entry_pair(e)
+            if not pair:
+                continue
+            seen += 1
+            if seen <= skip:
+                continue
+
+            emit(pair)
+            sent += 1
+            if skip + sent >= limit:
+                break
+
+    return sent
+
 def extract_playlist_flat(playlist_url: str, limit: int = PLAYLIST_LIMIT) -> List[Tuple[str, str]]:
     """
     입력값: playlist_url, limit
     출력값: [(title, video_url), ...] 최대 limit개
     """
-    with yt_dlp.YoutubeDL(YTDLP_OPTIONS_PLAYLIST_FLAT) as ydl:
-        info = ydl.extract_info(playlist_url, download=False)
-
-    entries = info.get("entries") or []
     out: List[Tuple[str, str]] = []
+    pump_playlist_flat(playlist_url, limit, out.append)
+    return out
 
-    for e in entries:
-        if not e:
-            continue
+# ==============================
+# ✅ 추출 실행기(스레드 / 프로세스 풀)
+# ==============================
+_extract_executor: Optional[ProcessPoolExecutor] = None
+
+def _extract_worker_init():
+    # 워커 프로세스는 한 번에 한 작업만 하므로 옵션셋당 1개만 예열
+    ytdl_pool.size = 1
+    ytdl_pool.warm()
+
+def get_extract_executor() -> ProcessPoolExecutor:
+    global _extract_executor
+    if _extract_executor is None:
+        _extract_executor = ProcessPoolExecutor(
+            max_workers=max(1, EXTRACT_WORKERS),
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_extract_worker_init,
+            max_tasks_per_child=EXTRACT_WORKER_MAX_JOBS if EXTRACT_WORKER_MAX_JOBS > 0 else None,
+        )
+    return _extract_executor
 
-        title = e.get("title") or "Unknown Title"
+async def run_extract(fn, *args):
+    """
+    입력값: fn(모듈 최상위 추출 함수), args
+    출력값: fn(*args) 결과(Track, 튜플 리스트 등 pickle 가능한 값만)
+    - EXTRACT_BACKEND == "process"면 프로세스 풀에서, 아니면 스레드에서 실행
+    """
+    global _extract_executor
+    if EXTRACT_BACKEND != "process":
+        return await asyncio.to_thread(fn, *args)
 
-        u = e.get("url") or e.get("webpage_url") or ""
-        if u and not u.startswith("http"):
-            u = "https://www.youtube.com/watch?v=" + u
-        if not u:
-            continue
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(get_extract_executor(), fn, *args)
+    except BrokenProcessPool:
+        # 워커가 죽으면 풀을 새로 만들고 이번 시도는 실패로 처리(재시도 루프가 다시 부름)
+        broken = _extract_executor
+        _extract_executor = None
+        if broken is not None:
+            broken.shutdown(wait=False, cancel_futures=True)
+        raise
 
-        out.append((title, u))
-        if len(out) >= limit:
-            break
+# ==============================
+# ✅ 추출 스케줄러(전역 동시 실행 제한 + 우선순위 + 길드 라운드로빈)
+# ==============================
+PRIO_INTERACTIVE = 0  # /재생, /우선예약
+PRIO_NEXT = 1         # 곧 재생할 곡(재생 직전 추출, 즉시 실패 재추출)
+PRIO_PREFETCH = 2     # 백그라운드 미리 추출
+PRIO_NAMES = ("interactive", "next", "prefetch")
 
-    return out
+class ExtractTicket:
+    """
+    추출 한 건의 순번표(길드, 우선순위)
+    - single-flight로 더 급한 요청이 합류하면 promote()로 대기 중 순서를 끌어올림
+    """
+    __slots__ = ("guild_id", "priority", "enqueued", "fut")
+
+    def __init__(self, guild_id: int, priority: int):
+        self.guild_id = guild_id
+        self.priority = priority
+        self.enqueued = 0.0
+        self.fut: Optional[asyncio.Future] = None
+
+class ExtractScheduler:
+    """
+    - 동시에 limit개까지만 추출 실행
+    - 대기 중이면 우선순위 높은 순, 같은 우선순위 안에서는 길드별로 한 건씩 번갈아
+    - 낮은 우선순위라도 EXTRACT_STARVATION_SEC 넘게 밀리면 먼저 보냄
+    """
+    def __init__(self, limit: int, name: str = "single"):
+        self.limit = max(1, limit)
+        self.name = name
+        self.active = 0
+        # 우선순위별 {guild_id: 대기열}. OrderedDict 순서가 라운드로빈 순서
+        self._classes: List["OrderedDict[int, Deque[ExtractTicket]]"] = [OrderedDict() for _ in PRIO_NAMES]
+
+    def has_free_slot(self) -> bool:
+        return self.active < self.limit and not any(self._classes)
+
+    def waiting(self, priority: int) -> int:
+        return sum(len(dq) for dq in self._classes[priority].values())
+
+    def _push(self, ticket: ExtractTicket):
+        ring = self._classes[ticket.priority]
+        dq = ring.get(ticket.guild_id)
+        if dq is None:
+            dq = ring[ticket.guild_id] = deque()
+        dq.append(ticket)
+
+    def _remove(self, ticket: ExtractTicket):
+        ring = self._classes[ticket.priority]
+        dq = ring.get(ticket.guild_id)
+        if dq is None:
+            return
+        try:
+            dq.remove(ticket)
+        except ValueError:
+            return
+        if not dq:
+            del ring[ticket.guild_id]
+
+    def _pop(self) -> Optional[ExtractTicket]:
+        now = time.monotonic()
+        chosen = None
+        for ring in self._classes:
+            if not ring:
+                continue
+            head = next(iter(ring.values()))[0]
+            if chosen is None:
+                chosen = ring
+            elif now - head.enqueued >= EXTRACT_STARVATION_SEC:
+                chosen = ring
+                break
+        if chosen is None:
+            return None
+        gid, dq = next(iter(chosen.items()))
+        ticket = dq.popleft()
+        # 뽑힌 길드는 맨 뒤로(남은 요청이 있으면)
+        del chosen[gid]
+        if dq:
+            chosen[gid] = dq
+        return ticket
+
+    def _wake(self):
+        while self.active < self.limit:
+            ticket = self._pop()
+            if ticket is None:
+                return
+            if ticket.fut.done():
+                # 취소됐지만 아직 대기열에서 못 빠진 요청
+                continue
+            self.active += 1
+            ticket.fut.set_result(None)
+
+    def promote(self, ticket: ExtractTicket, priority: int):
+        if priority >= ticket.priority:
+            return
+        queued = ticket.fut is not None and not ticket.fut.done()
+        if queued:
+            self._remove(ticket)
+        ticket.priority = priority
+        if queued:
+            self._push(ticket)
+
+    async def acquire(self, ticket: ExtractTicket):
+        ticket.enqueued = time.monotonic()
+        if self.active < self.limit and not any(self._classes):
+            self.active += 1
+            M_EXTRACT_QUEUE_WAIT.observe(0.0, pool=self.name, priority=PRIO_NAMES[ticket.priority])
+            return
 
-async def extract_with_retry_single(query: str) -> Track:
+        ticket.fut = asyncio.get_running_loop().create_future()
+        self._push(ticket)
+        try:
+            await ticket.fut
+        except asyncio.CancelledError:
+            if ticket.fut.done() and not ticket.fut.cancelled():
+                # 자리를 받은 직후 취소됨 -> 자리 반납
+                self.release()
+            else:
+                self._remove(ticket)
+            raise
+        finally:
+            ticket.fut = None
+        M_EXTRACT_QUEUE_WAIT.observe(
+            time.monotonic() - ticket.enqueued, pool=self.name, priority=PRIO_NAMES[ticket.priority]
+        )
+
+    def release(self):
+        self.active -= 1
+        self._wake()
+
+    @asynccontextmanager
+    async def slot(self, ticket: ExtractTicket):
+        await self.acquire(ticket)
+        try:
+            yield
+        finally:
+            self.release()
+
+extract_scheduler = ExtractScheduler(EXTRACT_CONCURRENCY)
+# ✅ 플리 목록은 한 번 잡으면 오래 걸려서 단일곡 자리와 따로 둠(플리가 단일곡/다음 곡 추출을 막지 않게)
+playlist_scheduler = ExtractScheduler(PLAYLIST_CONCURRENCY, name="playlist")
+metrics.gauge(
+    "bot_extract_active", "extractions holding a scheduler slot", ("pool",),
+    lambda: [((sch.name,), sch.active) for sch in (extract_scheduler, playlist_scheduler)],
+)
+metrics.gauge(
+    "bot_extract_queue_depth", "extractions waiting for a scheduler slot", ("pool", "priority"),
+    lambda: [
+        ((sch.name, name), sch.waiting(p))
+        for sch in (extract_scheduler, playlist_scheduler)
+        for p, name in enumerate(PRIO_NAMES)
+    ],
+)
+
+# ==============================
+# ✅ player_client별 서킷 브레이커
+# ==============================
+# 영상 자체 문제(비공개/삭제/연령 제한/지역 차단) 메시지. client를 바꾸거나 다시 해도 안 되므로
+# 브레이커에 세지 않고, 헤지/재시도도 하지 않음
+VIDEO_UNAVAILABLE_MARKERS = (
+    "private video",
+    "video unavailable",
+    "this video is unavailable",
+    "this video has been removed",
+    "no longer available",
+    "confirm your age",
+    "age-restricted",
+    "inappropriate for some users",
+    "available in your country",
+    "blocked it in your country",
+    "geo restricted",
+    "members-only",
+    "join this channel",
+)
+
+def video_unavailable(error: BaseException) -> bool:
+    """
+    입력값: 추출 중 난 예외(프로세스 풀에서 넘어온 것 포함)
+    출력값: 영상 자체를 재생할 수 없는 경우면 True(통신/추출기 오류는 False)
+    """
+    # DownloadError는 원래 예외를 exc_info에 담아 둠
+    inner = (getattr(error, "exc_info", None) or (None, None))[1]
+    if isinstance(error, yt_dlp.utils.GeoRestrictedError) or isinstance(inner, yt_dlp.utils.GeoRestrictedError):
+        return True
+    msg = str(error).lower()
+    return any(m in msg for m in VIDEO_UNAVAILABLE_MARKERS)
+
+class ClientBreaker:
+    """
+    - 연속 실패가 CLIENT_BREAKER_FAILS번이면 열림(COOLDOWN 동안 후순위)
+    - 쿨다운이 지나면 다시 시도해 보고, 성공하면 닫힘 / 실패하면 다시 열림
+    """
+    def __init__(self, clients: List[str]):
+        self.clients = list(clients)
+        self._fails: Dict[str, int] = {c: 0 for c in clients}
+        self._open_until: Dict[str, float] = {c: 0.0 for c in clients}
+
+    def is_open(self, client: str) -> bool:
+        return self._open_until.get(client, 0.0) > time.monotonic()
+
+    def order(self) -> List[str]:
+        """
+        출력값: 시도할 client 순서(닫힌 것 먼저 설정 순서대로, 열린 것은 먼저 풀리는 순서로 뒤에)
+        """
+        closed = [c for c in self.clients if not self.is_open(c)]
+        opened = sorted((c for c in self.clients if self.is_open(c)), key=lambda c: self._open_until[c])
+        return closed + opened
+
+    def record(self, client: str, ok: bool):
+        if ok:
+            self._fails[client] = 0
+            self._open_until[client] = 0.0
+            return
+        self._fails[client] = self._fails.get(client, 0) + 1
+        if self._fails[client] >= CLIENT_BREAKER_FAILS:
+            if not self.is_open(client):
+                print(f"[추출] player_client={client} 연속 {self._fails[client]}회 실패 -> {CLIENT_BREAKER_COOLDOWN_SEC:.0f}초간 후순위", flush=True)
+            self._open_until[client] = time.monotonic() + CLIENT_BREAKER_COOLDOWN_SEC
+
+client_breaker = ClientBreaker(YTDLP_PLAYER_CLIENTS)
+metrics.gauge(
+    "bot_extract_client_open", "1 while a player client's circuit breaker is open", ("client",),
+    lambda: [((c,), int(client_breaker.is_open(c))) for c in client_breaker.clients],
+)
+
+async def extract_with_client(target: str, client: str, ticket: ExtractTicket) -> Track:
+    async with extract_scheduler.slot(ticket):
+        try:
+            track = await run_extract(extract_single_track, target, client)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if video_unavailable(e):
+                # client 잘못이 아님 -> 브레이커에 세지 않음
+                M_EXTRACT_CLIENT.inc(client=client, result="unavailable")
+                raise
+            client_breaker.record(client, False)
+            M_EXTRACT_CLIENT.inc(client=client, result="fail")
+            raise
+    client_breaker.record(client, True)
+    M_EXTRACT_CLIENT.inc(client=client, result="ok")
+    return track
+
+async def hedged_extract(target: str, ticket: ExtractTicket) -> Track:
+    """
+    입력값: target, ticket
+    출력값: 먼저 성공한 client의 Track
+    - 1순위 client가 EXTRACT_HEDGE_DELAY_SEC 안에 답이 없거나 바로 실패하면 2순위 client로 한 번 더 추출
+    - 영상 자체를 재생할 수 없다는 실패(video_unavailable)면 헤지 없이 바로 그 에러를 냄
+    - 느려서 거는 헤지는 스케줄러에 빈자리가 있을 때만(혼잡할 때 부하를 두 배로 만들지 않음)
+    - 진 쪽 작업은 취소(스레드 안 yt-dlp는 끝까지 돌지만 스케줄러 자리는 바로 반납)
+    """
+    clients = client_breaker.order()
+    legs = [asyncio.create_task(extract_with_client(target, clients[0], ticket))]
+    alternates = clients[1:] if EXTRACT_HEDGE_DELAY_SEC > 0 else []
+    last_err: Optional[BaseException] = None
+    try:
+        while legs:
+            timeout = EXTRACT_HEDGE_DELAY_SEC if alternates else None
+            done, _ = await asyncio.wait(legs, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            for t in done:
+                legs.remove(t)
+                if t.exception() is None:
+                    return t.result()
+                last_err = t.exception()
+                if video_unavailable(last_err):
+                    raise last_err
+
+            if not alternates:
+                continue
+            if not done and not extract_scheduler.has_free_slot():
+                continue
+            M_EXTRACT_HEDGES.inc(reason="failed" if done else "slow")
+            client = alternates.pop(0)
+            hedge_ticket = ExtractTicket(ticket.guild_id, ticket.priority)
+            legs.append(asyncio.create_task(extract_with_client(target, client, hedge_ticket)))
+        raise last_err if last_err else Exception("알 수 없는 추출 실패")
+    finally:
+        for t in legs:
+            t.cancel()
+
+_PUMP_DONE = object()
+
+async def stream_playlist_flat(url: str, limit: int, skip: int = 0):
+    """
+    입력값: url, limit, skip
+    출력값: (비동기 제너레이터) [(title, video_url), ...] 묶음
+    - 첫 곡은 혼자 바로, 이후는 도착한 만큼(최대 PLAYLIST_BATCH_SIZE개) 묶어서 넘김
+    - 소비 쪽이 취소되면 스레드도 다음 곡에서 멈춤
+    """
+    if EXTRACT_BACKEND == "process":
+        # 프로세스 사이로는 곡을 하나씩 흘려보내기 어려워서 목록을 통째로 받은 뒤 나눠서 넘김
+        pairs = (await run_extract(extract_playlist_flat, url, limit))[skip:]
+        if pairs:
+            yield pairs[:1]
+        for i in range(1, len(pairs), PLAYLIST_BATCH_SIZE):
+            yield pairs[i:i + PLAYLIST_BATCH_SIZE]
+        return
+
+    loop = asyncio.get_running_loop()
+    q: asyncio.Queue = asyncio.Queue()
+    stop = threading.Event()
+
+    def emit(item):
+        loop.call_soon_threadsafe(q.put_nowait, item)
+
+    def run():
+        try:
+            pump_playlist_flat(url, limit, emit, skip=skip, stop=stop)
+            emit(_PUMP_DONE)
+        except Exception as e:
+            emit(e)
+
+    loop.run_in_executor(None, run)
+
+    try:
+        batch: List[Tuple[str, str]] = []
+        first = True
+        while True:
+            item = await q.get()
+            if item is _PUMP_DONE:
+                break
+            if isinstance(item, Exception):
+                # 실패 전에 받은 곡은 넘겨서 재시도 때 건너뛰게 함
+                if batch:
+                    yield batch
+                raise item
+
+            batch.append(item)
+            if first or len(batch) >= PLAYLIST_BATCH_SIZE or q.empty():
+                yield batch
+                batch = []
+                first = False
+
+        if batch:
+            yield batch
+    finally:
+        stop.set()
+
+# ==============================
+# ✅ 같은 곡 동시 추출 합치기(single-flight)
+# ==============================
+class _Flight:
+    __slots__ = ("task", "waiters", "ticket")
+
+    def __init__(self, task: asyncio.Task, ticket: Optional[ExtractTicket]):
+        self.task = task
+        self.waiters = 0
+        self.ticket = ticket
+
+class SingleFlight:
+    """
+    같은 키로 동시에 들어온 요청은 작업 하나를 함께 기다림
+    - 실패하면 기다리던 쪽 모두에게 같은 예외가 감
+    - 기다리던 쪽이 전부 취소되면(예: /퇴장으로 미리 추출 취소) 작업도 취소하고 표에서 뺌
+    """
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    def _drop(self, key: str, flight: _Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    async def run(
+        self, key: str, factory: Callable[[], Awaitable[Any]], ticket: Optional[ExtractTicket] = None
+    ) -> Any:
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(factory()), ticket)
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _t, key=key, flight=flight: self._drop(key, flight))
+        else:
+            M_EXTRACT_COALESCED.inc()
+            # 미리 추출 중인 곡을 /재생으로 또 찾으면 그 작업의 대기 순서를 끌어올림
+            if ticket is not None and flight.ticket is not None:
+                extract_scheduler.promote(flight.ticket, ticket.priority)
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                flight.task.cancel()
+                self._drop(key, flight)
+
+single_flights = SingleFlight()
+metrics.gauge("bot_extract_inflight", "distinct single-track extractions in flight", (), lambda: [((), len(single_flights))])
+
+async def extract_with_retry_single(
+    query: str,
+    *,
+    fresh_stream: bool = False,
+    requester: int = 0,
+    guild_id: int = 0,
+    priority: int = PRIO_INTERACTIVE,
+) -> Track:
+    """
+    입력값: query, fresh_stream(True면 캐시된 스트림 URL을 버리고 새로 추출), requester, guild_id, priority
+    출력값: 호출한 쪽 전용 Track. 캐시에 유효한 스트림 URL이 있으면 네트워크 없이 반환
+    - 같은 곡을 동시에 찾으면 추출은 한 번만 하고 결과를 나눠 받음
+    - 실제 yt-dlp 호출은 extract_scheduler 순서를 따름
+    """
+    if fresh_stream:
+        track_cache.invalidate_stream(query)
+
+    cached = track_cache.get(query)
+    M_TRACK_CACHE.inc(tier="memory", result="hit" if cached else "miss")
+    if cached and cached.stream_valid():
+        return cached.to_track().copy_with(requester=requester)
+
+    # ✅ 같은 영상이면 검색어/URL 형태가 달라도 한 번만 추출(영상 ID 기준으로 묶음)
+    # fresh_stream 요청은 디스크 캐시의 스트림 URL을 받으면 안 되므로 따로 묶음
+    key = track_cache.flight_key(query) + ("|fresh" if fresh_stream else "")
+    ticket = ExtractTicket(guild_id, priority)
+    track = await single_flights.run(key, lambda: _resolve_single(query, cached, fresh_stream, ticket), ticket)
+    return track.copy_with(requester=requester)
+
+async def _resolve_single(
+    query: str, cached: Optional[CachedTrack], fresh_stream: bool, ticket: ExtractTicket
+) -> Track:
+    """
+    입력값: query, cached(메모리 캐시 항목), fresh_stream, ticket
+    출력값: Track(requester=0). 디스크 캐시 확인 후 필요하면 yt-dlp 추출
+    """
+    if cached is None and resolve_store is not None:
+        # ✅ 메모리에 없으면 디스크 캐시 확인 후 메모리로 올림
+        found = await asyncio.to_thread(resolve_store.lookup, query, with_stream=not fresh_stream)
+        M_TRACK_CACHE.inc(tier="disk", result="hit" if found else "miss")
+        if found:
+            key, cached = found
+            track_cache.put_entry(query, key, cached)
+
+    if cached and cached.stream_valid():
+        return cached.to_track()
+
+    # ✅ 로컬 오디오 캐시에 있는 곡은 스트림 URL이 필요 없음
+    if cached and not fresh_stream and audio_cache is not None and audio_cache.has(cached.to_track()):
+        return cached.to_track()
+
+    # ✅ 메타가 남아 있으면 검색 없이 영상 URL로 스트림만 다시 뽑음
+    target = cached.url if cached else query
+
+    track = await extract_single_attempts(target, ticket)
+    if cached:
+        updated = track_cache.update_stream(cached.url, track)
+        if updated and resolve_store is not None:
+            resolve_store.enqueue(query, *updated)
+        return cached.to_track().copy_with(stream_url=track.stream_url, stream_expire=track.stream_expire)
+    key, entry = track_cache.put(query, track)
+    if resolve_store is not None:
+        resolve_store.enqueue(query, key, entry)
+    return track
+
+async def extract_single_attempts(target: str, ticket: Optional[ExtractTicket] = None) -> Track:
+    """
+    입력값: target(URL 또는 검색어), ticket(없으면 대화형 우선순위)
+    출력값: Track (캐시 거치지 않고 yt-dlp로 추출, 최대 4회 시도)
+    - 시도마다 스케줄러 자리를 받고, 재시도 대기(sleep) 중에는 자리를 비워 둠
+    - 비공개/삭제/연령 제한/지역 차단 영상은 다시 해도 안 되므로 재시도하지 않음
+    """
+    ticket = ticket or ExtractTicket(0, PRIO_INTERACTIVE)
     last_err: Optional[Exception] = None
     for attempt in range(1, 5):
+        if attempt > 1:
+            M_EXTRACT_RETRIES.inc(kind="single")
+        start = time.monotonic()
         try:
-            return await asyncio.to_thread(extract_single_track, query)
+            track = await hedged_extract(target, ticket)
+            M_EXTRACT_ATTEMPTS.inc(kind="single", result="ok")
+            M_EXTRACT_SECONDS.observe(time.monotonic() - start, kind="single")
+            return track
         except Exception as e:
+            unavailable = video_unavailable(e)
+            M_EXTRACT_ATTEMPTS.inc(kind="single", result="unavailable" if unavailable else "fail")
+            M_EXTRACT_SECONDS.observe(time.monotonic() - start, kind="single")
+            if unavailable:
+                print("재생할 수 없는 영상(재시도 안 함):", repr(e), flush=True)
+                raise
             last_err = e
             print(f"{attempt}차 추출 실패:", repr(e), flush=True)
             await asyncio.sleep(min(2 * attempt, 6))
     raise last_err if last_err else Exception("알 수 없는 추출 실패")
 
-async def extract_with_retry_playlist_flat(url: str, limit: int) -> List[Tuple[str, str]]:
+async def extract_with_retry_playlist_flat(
+    url: str,
+    limit: int,
+    on_batch: Callable[[List[Tuple[str, str]]], Awaitable[None]],
+    guild_id: int = 0,
+) -> int:
+    """
+    입력값: url, limit, on_batch(곡 묶음을 받는 비동기 콜백), guild_id
+    출력값: on_batch로 넘긴 총 곡 수
+    - 중간에 실패하면 이미 넘긴 곡은 건너뛰고 이어서 재시도
+    - 목록을 받는 동안 플리 전용 스케줄러 자리 1개를 차지함(길드당 플리는 한 번에 하나)
+    """
+    ticket = ExtractTicket(guild_id, PRIO_INTERACTIVE)
+    delivered = 0
     last_err: Optional[Exception] = None
     for attempt in range(1, 4):
+        if attempt > 1:
+            M_EXTRACT_RETRIES.inc(kind="playlist")
+        start = time.monotonic()
         try:
-            return await asyncio.to_thread(extract_playlist_flat, url, limit)
+            async with playlist_scheduler.slot(ticket):
+                async for batch in stream_playlist_flat(url, limit, skip=delivered):
+                    delivered += len(batch)
+                    await on_batch(batch)
+            M_EXTRACT_ATTEMPTS.inc(kind="playlist", result="ok")
+            M_EXTRACT_SECONDS.observe(time.monotonic() - start, kind="playlist")
+            return delivered
         except Exception as e:
+            M_EXTRACT_ATTEMPTS.inc(kind="playlist", result="fail")
+            M_EXTRACT_SECONDS.observe(time.monotonic() - start, kind="playlist")
             last_err = e
-            print(f"[플리] {attempt}차 목록 추출 실패:", repr(e), flush=True)
+            print(f"[플리] {attempt}차 목록 추출 실패({delivered}곡까지 적재):", repr(e), flush=True)
             await asyncio.sleep(min(2 * attempt, 6))
+    if delivered:
+        # 일부라도 들어갔으면 거기까지로 마무리
+        return delivered
     raise last_err if last_err else Exception("플레이리스트 목록을 못 가져왔어.")
 
+class MusicBot(commands.Bot):
+    async def close(self):
+        # ✅ 재배포/종료 때 마지막 주기 사이의 상태를 잃지 않게, 음성 연결을 끊기 전에 스냅샷을 한 번 더 씀
+        if SNAPSHOT_DIR:
+            try:
+                await flush_snapshots(final=True)
+            except Exception as e:
+                print("[스냅샷] 종료 전 저장 실패:", repr(e), flush=True)
+        await super().close()
+
 intents = discord.Intents.default()
-bot = commands.Bot(command_prefix="!", intents=intents)
+bot = MusicBot(command_prefix="!", intents=intents)
 
 # ==============================
 # ✅ 슬래시 커맨드 공통 권한 체크 + BUSY 체크
@@ -329,10 +2262,8 @@ async def require_not_busy(interaction: discord.Interaction, allow_leave: bool =
     """
     if not interaction.guild:
         return
-    music = get_music(interaction.guild.id)
-    async with music.lock:
-        busy = music.is_busy
-    if busy and not allow_leave:
+    music = music_data.get(interaction.guild.id)
+    if music is not None and music.is_busy and not allow_leave:
         raise Exception(MSG_BUSY)
 
 # ==============================
@@ -359,19 +2290,25 @@ def build_panel_embed(guild: discord.Guild, music: GuildMusic) -> discord.Embed:
     vc = guild.voice_client
     channel_name = vc.channel.name if (vc and vc.is_connected() and vc.channel) else "-"
 
-    now = music.now_playing
-    next_track = music.queue[0] if music.queue else None
+    view = music.view()
+    now = view.now_playing
+    next_track = view.upcoming[0] if view.upcoming else None
 
     embed = discord.Embed(title="곽덕춘")
 
     requester_name = _requester_name(guild, now.requester) if now else "-"
-    busy_text = " | 🔧 플리 처리중" if music.is_busy else ""
+    if view.busy:
+        busy_text = " | 🔧 플리 처리중"
+    elif view.loading:
+        busy_text = " | 📥 플리 불러오는 중"
+    else:
+        busy_text = ""
 
     embed.add_field(
         name="",
         value=(
             f"상태: {status} | 요청자: {requester_name} | 음성 채널: {channel_name}{busy_text}\n"
-            f"{repeat_label(music.repeat_mode)}"
+            f"{repeat_label(view.repeat_mode)}"
         ),
         inline=False,
     )
@@ -406,17 +2343,135 @@ async def fetch_panel_channel(guild: discord.Guild, music: GuildMusic):
     ch = guild.get_channel(music.panel_channel_id)
     if ch is None:
         try:
+            M_PANEL_REST.inc(op="fetch_channel")
             ch = await guild.fetch_channel(music.panel_channel_id)
         except Exception:
             return None
 
     if not hasattr(ch, "send"):
         return None
-    if not hasattr(ch, "fetch_message"):
+    if not hasattr(ch, "get_partial_message"):
         return None
     return ch
 
+class ChannelRateLimiter:
+    """
+    채널별 슬라이딩 윈도우 제한: window_sec 동안 최대 limit회.
+    - wait()는 자리가 날 때까지 기다린 뒤 1회를 차지함
+    """
+    def __init__(self, limit: int, window_sec: float):
+        self.limit = max(1, limit)
+        self.window_sec = window_sec
+        self._sent: Dict[int, Deque[float]] = {}
+
+    async def wait(self, channel_id: int):
+        while True:
+            now = time.monotonic()
+            sent = self._sent.setdefault(channel_id, deque())
+            while sent and now - sent[0] >= self.window_sec:
+                sent.popleft()
+            if len(sent) < self.limit:
+                sent.append(now)
+                return
+            await asyncio.sleep(self.window_sec - (now - sent[0]))
+
+    def forget(self, channel_id: Optional[int]):
+        if channel_id is not None:
+            self._sent.pop(channel_id, None)
+
+
+panel_edit_limiter = ChannelRateLimiter(PANEL_EDITS_PER_WINDOW, PANEL_EDIT_WINDOW_SEC)
+
+def panel_digest(embed: discord.Embed, repeat_mode: str) -> str:
+    return json.dumps([embed.to_dict(), repeat_mode], sort_keys=True, ensure_ascii=False)
+
+
+class PanelRenderer:
+    """
+    길드별 패널 갱신기.
+    - request()는 갱신 표시만 하고 바로 반환, PANEL_DEBOUNCE_SEC 안에 몰린 요청은 한 번에 처리
+    - 보낸 Message 객체를 들고 있어서 매번 fetch_message(REST GET) 하지 않음
+    - 임베드/버튼 내용이 마지막으로 보낸 것과 같으면 수정 생략
+    - 수정 전에 채널별 제한(panel_edit_limiter)을 기다림
+    """
+    def __init__(self):
+        self.message: Optional[discord.Message] = None
+        self.last_digest: Optional[str] = None
+        self._dirty = False
+        self._task: Optional[asyncio.Task] = None
+
+    def request(self, guild: discord.Guild, music: "GuildMusic"):
+        self._dirty = True
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(guild, music))
+
+    def active(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def reset(self):
+        if self._task and not self._task.done() and self._task is not asyncio.current_task():
+            self._task.cancel()
+        self._task = None
+        self._dirty = False
+        self.message = None
+        self.last_digest = None
+
+    async def _run(self, guild: discord.Guild, music: "GuildMusic"):
+        try:
+            while self._dirty:
+                await asyncio.sleep(PANEL_DEBOUNCE_SEC)
+                self._dirty = False
+                await self._flush(guild, music)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print("패널 갱신 실패:", repr(e), flush=True)
+
+    async def _flush(self, guild: discord.Guild, music: "GuildMusic"):
+        ch = await fetch_panel_channel(guild, music)
+        if not ch:
+            return
+
+        embed = build_panel_embed(guild, music)
+        repeat_mode_snapshot = music.repeat_mode
+        digest = panel_digest(embed, repeat_mode_snapshot)
+        if music.panel_message_id and digest == self.last_digest:
+            M_PANEL_SKIPPED.inc()
+            return
+
+        await panel_edit_limiter.wait(ch.id)
+        if self._dirty:
+            # 기다리는 사이 상태가 또 바뀜 -> 다음 차례에 최신 상태로 한 번만 보냄
+            return
+
+        view = MusicControlView(repeat_mode=repeat_mode_snapshot)
+
+        if music.panel_message_id:
+            msg = self.message
+            if msg is None or msg.id != music.panel_message_id or msg.channel.id != ch.id:
+                msg = ch.get_partial_message(music.panel_message_id)
+            try:
+                M_PANEL_REST.inc(op="edit")
+                self.message = await msg.edit(embed=embed, view=view)
+                self.last_digest = digest
+                return
+            except Exception:
+                # 메시지가 지워졌거나 다른 채널 것 -> 새로 생성
+                music.panel_message_id = None
+                self.message = None
+
+        try:
+            M_PANEL_REST.inc(op="send")
+            msg = await ch.send(embed=embed, view=view)
+            music.panel_message_id = msg.id
+            self.message = msg
+            self.last_digest = digest
+        except Exception as e:
+            print("패널 생성 실패:", repr(e), flush=True)
+
 async def delete_panel(guild: discord.Guild, music: GuildMusic):
+    music.panel.reset()
+
     if not music.panel_channel_id or not music.panel_message_id:
         music.panel_channel_id = None
         music.panel_message_id = None
@@ -429,39 +2484,20 @@ async def delete_panel(guild: discord.Guild, music: GuildMusic):
         return
 
     try:
-        msg = await ch.fetch_message(music.panel_message_id)
-        await msg.delete()
+        M_PANEL_REST.inc(op="delete")
+        await ch.get_partial_message(music.panel_message_id).delete()
     except Exception:
         pass
 
+    panel_edit_limiter.forget(music.panel_channel_id)
     music.panel_channel_id = None
     music.panel_message_id = None
 
 async def upsert_panel(guild: discord.Guild, music: GuildMusic):
-    ch = await fetch_panel_channel(guild, music)
-    if not ch:
-        return
-
-    async with music.lock:
-        repeat_mode_snapshot = music.repeat_mode
-
-    embed = build_panel_embed(guild, music)
-    view = MusicControlView(repeat_mode=repeat_mode_snapshot)
-
-    if not music.panel_message_id:
-        try:
-            msg = await ch.send(embed=embed, view=view)
-            music.panel_message_id = msg.id
-        except Exception as e:
-            print("패널 생성 실패:", repr(e), flush=True)
-        return
-
-    try:
-        msg = await ch.fetch_message(music.panel_message_id)
-        await msg.edit(embed=embed, view=view)
-    except Exception:
-        music.panel_message_id = None
-        await upsert_panel(guild, music)
+    """
+    출력: 패널 갱신 예약(실제 전송은 PanelRenderer가 모아서 처리)
+    """
+    music.panel.request(guild, music)
 
 # ==============================
 # 버튼 UI (✅ Persistent)
@@ -546,9 +2582,9 @@ class MusicControlView(discord.ui.View):
         music = get_music(interaction.guild.id)
         touch_command(music)
 
-        async with music.lock:
-            if len(music.queue) >= 2:
-                shuffle_queue_inplace(music)
+        if len(music.queue) >= 2:
+            shuffle_queue_inplace(music)
+        schedule_prefetch(music)
 
         await upsert_panel(interaction.guild, music)
         await interaction.response.defer()
@@ -564,14 +2600,13 @@ class MusicControlView(discord.ui.View):
         music = get_music(interaction.guild.id)
         touch_command(music)
 
-        async with music.lock:
-            if music.repeat_mode == "off":
-                music.repeat_mode = "all"
-            elif music.repeat_mode == "all":
-                music.repeat_mode = "one"
-            else:
-                music.repeat_mode = "off"
-            button.style = repeat_button_style(music.repeat_mode)
+        if music.repeat_mode == "off":
+            music.repeat_mode = "all"
+        elif music.repeat_mode == "all":
+            music.repeat_mode = "one"
+        else:
+            music.repeat_mode = "off"
+        button.style = repeat_button_style(music.repeat_mode)
 
         await upsert_panel(interaction.guild, music)
         await interaction.response.defer()
@@ -587,9 +2622,8 @@ class MusicControlView(discord.ui.View):
         music = get_music(interaction.guild.id)
         touch_command(music)
 
-        async with music.lock:
-            music.skip_flag = True
-            music.now_playing = None
+        music.skip_flag = True
+        music.now_playing = None
 
         vc = interaction.guild.voice_client
         if vc and vc.is_connected() and (vc.is_playing() or vc.is_paused()):
@@ -609,16 +2643,15 @@ class MusicControlView(discord.ui.View):
         music = get_music(interaction.guild.id)
         touch_command(music)
 
-        async with music.lock:
-            if not music.queue:
-                await safe_reply(interaction, "대기열이 비어있어.", ephemeral=True)
-                return
+        view = music.view()
+        if not view.queue_len:
+            await safe_reply(interaction, "대기열이 비어있어.", ephemeral=True)
+            return
 
-            items = list(music.queue)[:20]
-            lines = [f"{i}. {t.title}" for i, t in enumerate(items, start=1)]
-            more = len(music.queue) - len(items)
-            if more > 0:
-                lines.append(f"...그리고 {more}개 더 있어.")
+        lines = [f"{i}. {t.title}" for i, t in enumerate(view.upcoming, start=1)]
+        more = view.queue_len - len(view.upcoming)
+        if more > 0:
+            lines.append(f"...그리고 {more}개 더 있어.")
 
         await upsert_panel(interaction.guild, music)
         await safe_reply(interaction, "📃 대기열\n" + "\n".join(lines), ephemeral=True)
@@ -656,10 +2689,17 @@ async def connect_voice(interaction: discord.Interaction) -> discord.VoiceClient
             raise Exception(MSG_DIFF_VOICE_IN_USE)
         return vc
 
+    return await connect_channel(channel)
+
+async def connect_channel(channel) -> discord.VoiceClient:
     # ✅ 여기서 TimeoutError가 자주 나며 str(e)가 빈 경우가 있음
+    start = time.monotonic()
     try:
-        return await asyncio.wait_for(channel.connect(), timeout=VOICE_CONNECT_TIMEOUT)
+        vc = await asyncio.wait_for(channel.connect(), timeout=VOICE_CONNECT_TIMEOUT)
+        M_VOICE_CONNECT_SECONDS.observe(time.monotonic() - start)
+        return vc
     except asyncio.TimeoutError as e:
+        M_VOICE_CONNECT_TIMEOUTS.inc()
         raise asyncio.TimeoutError(MSG_VOICE_TIMEOUT) from e
 
 async def do_leave(guild: discord.Guild, music: GuildMusic):
@@ -671,110 +2711,1043 @@ async def do_leave(guild: discord.Guild, music: GuildMusic):
     vc = guild.voice_client
 
     # ✅ 플리 작업 즉시 취소
-    playlist_task = None
-    async with music.lock:
-        playlist_task = music.playlist_task
+    playlist_task = music.playlist_task
     if playlist_task and not playlist_task.done() and playlist_task is not current:
         playlist_task.cancel()
 
-    # 재생 중이면 중지
-    if vc and (vc.is_playing() or vc.is_paused()):
-        vc.stop()
+    # 재생 중이면 중지
+    if vc and (vc.is_playing() or vc.is_paused()):
+        vc.stop()
+
+    music.queue.clear()
+    music.now_playing = None
+    music.skip_flag = False
+    music.is_busy = False
+    music.playlist_task = None
+    cancel_prefetch(music)
+
+    # 음성 채널 연결 해제
+    try:
+        if vc and vc.is_connected():
+            await vc.disconnect()
+    except Exception:
+        pass
+
+    # 태스크 정리(자기 자신은 취소하지 않음)
+    if music.player_task and not music.player_task.done() and music.player_task is not current:
+        music.player_task.cancel()
+
+    idle_timers.cancel(music.guild_id)
+    schedule_evict(music)
+    await discard_snapshot(music)
+
+    # 패널 삭제는 취소 영향 받지 않게 보호
+    try:
+        await asyncio.shield(delete_panel(guild, music))
+    except Exception:
+        pass
+
+# ==============================
+# 유휴 감시
+# ==============================
+async def on_idle_deadline(guild_id: int):
+    """
+    출력: 마지막 명령 후 IDLE_TIMEOUT_SEC 동안 재생/대기열이 없으면 퇴장
+    - 아직 재생중/일시정지/대기열 있으면 IDLE_TIMEOUT_SEC 뒤로 다시 걸어 둠(안전망)
+    - 재생이 멈추는 모든 경로(정상 종료/스킵/추출 실패/vc.play 에러)는 touch_command로 새로 맞춤
+    """
+    guild = bot.get_guild(guild_id)
+    music = music_data.get(guild_id)
+    if music is None:
+        return
+
+    vc = guild.voice_client if guild else None
+    if not vc or not vc.is_connected():
+        # 음성에 안 들어간 채 명령만 쓴 길드(또는 나간 서버) -> 상태만 정리
+        schedule_evict(music)
+        return
+
+    if vc.is_playing() or vc.is_paused() or music.queue or music.now_playing is not None:
+        idle_timers.arm(guild_id, IDLE_TIMEOUT_SEC)
+        return
+
+    remaining = IDLE_TIMEOUT_SEC - (time.monotonic() - music.last_command_ts)
+    if remaining > 0:
+        idle_timers.arm(guild_id, remaining)
+        return
+
+    await do_leave(guild, music)
+
+# ==============================
+# ✅ 재생 직전 지연 추출
+# ==============================
+async def ensure_stream_ready(track: Track, music: Optional[GuildMusic] = None) -> Track:
+    # ✅ 반복 재생으로 다시 들어온 곡은 예전 URL이 만료됐을 수 있음
+    if track.stream_usable():
+        return track
+
+    # ✅ 로컬 캐시 파일이 실제로 있으면 스트림 URL 없이 파일로 재생
+    # (has()만 보면 밖에서 지워진 파일도 있다고 나옴 -> path_for로 확인, 없으면 아래 추출로)
+    if audio_cache is not None and audio_cache.path_for(track) is not None:
+        return track
+
+    # ✅ 미리 추출이 진행 중이면 중복 추출 대신 그 결과를 기다림
+    job = music.prefetch_jobs.get(id(track)) if music else None
+    if job and not job.done():
+        try:
+            await asyncio.shield(job)
+        except Exception:
+            pass
+        if track.stream_usable():
+            return track
+
+    return await extract_with_retry_single(
+        track.url,
+        requester=track.requester,
+        guild_id=music.guild_id if music else 0,
+        priority=PRIO_NEXT,
+    )
+
+# ==============================
+# ✅ 다음 곡 미리 추출(재생 중 백그라운드)
+# ==============================
+async def prefetch_track(music: GuildMusic, track: Track):
+    try:
+        fresh = await extract_with_retry_single(track.url, guild_id=music.guild_id, priority=PRIO_PREFETCH)
+        # 같은 Track 객체를 갱신하므로 셔플/순서 변경 후에도 결과가 따라감
+        track.stream_url = fresh.stream_url
+        track.stream_expire = fresh.stream_expire
+        if track.duration is None:
+            track.duration = fresh.duration
+        if track.thumbnail is None:
+            track.thumbnail = fresh.thumbnail
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        print("[미리 추출] 실패:", repr(e), flush=True)
+    finally:
+        if music.prefetch_jobs.get(id(track)) is asyncio.current_task():
+            del music.prefetch_jobs[id(track)]
+
+def schedule_prefetch(music: GuildMusic):
+    """
+    출력: 대기열 앞 PREFETCH_AHEAD곡 중 스트림 URL이 없거나 만료된 곡을 백그라운드 추출
+    - 셔플/취소/우선예약 후 다시 부르면 범위를 벗어난 곡의 작업은 취소됨
+    - 지금 재생 준비 중인 곡(now_playing)의 작업은 취소하지 않음
+    """
+    if PREFETCH_AHEAD <= 0:
+        return
+
+    wanted: Dict[int, Track] = {}
+    for i in range(min(PREFETCH_AHEAD, len(music.queue))):
+        t = music.queue[i]
+        wanted[id(t)] = t
+    if music.now_playing is not None:
+        wanted.setdefault(id(music.now_playing), music.now_playing)
+
+    for key, job in list(music.prefetch_jobs.items()):
+        if key not in wanted:
+            job.cancel()
+            del music.prefetch_jobs[key]
+
+    for key, t in wanted.items():
+        if key in music.prefetch_jobs or t.stream_usable():
+            continue
+        if audio_cache is not None and audio_cache.has(t):
+            continue
+        if t is music.now_playing:
+            continue
+        music.prefetch_jobs[key] = asyncio.create_task(prefetch_track(music, t))
+
+def cancel_prefetch(music: GuildMusic):
+    for job in music.prefetch_jobs.values():
+        job.cancel()
+    music.prefetch_jobs.clear()
+
+# ==============================
+# ✅ 로컬 오디오 캐시(자주 트는 곡을 Opus 파일로 저장)
+# ==============================
+class AudioCache:
+    """
+    AUDIO_CACHE_MIN_PLAYS번 이상 재생된 곡을 백그라운드에서 한 번만 Opus 파일로 저장.
+    - 파일명: <영상ID>.opus (변환 중에는 .part)
+    - 전체 크기가 max_bytes를 넘으면 가장 오래 안 쓴 파일부터 삭제(LRU)
+    - 부팅 시 디렉터리를 읽어서 수정 시각 순으로 목록 복구
+    """
+    def __init__(self, directory: str, max_bytes: int, min_plays: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.min_plays = max(1, min_plays)
+        self._files: "OrderedDict[str, int]" = OrderedDict()  # 영상ID -> 크기
+        self._total = 0
+        self._plays: "OrderedDict[str, int]" = OrderedDict()
+        self._jobs: Dict[str, asyncio.Task] = {}
+        self._sem = asyncio.Semaphore(AUDIO_CACHE_JOBS)
+
+        os.makedirs(directory, exist_ok=True)
+        found = []
+        for name in os.listdir(directory):
+            full = os.path.join(directory, name)
+            if name.endswith(".part"):
+                # 변환 도중 꺼진 찌꺼기
+                try:
+                    os.remove(full)
+                except OSError:
+                    pass
+                continue
+            if not name.endswith(".opus"):
+                continue
+            st = os.stat(full)
+            found.append((st.st_mtime, name[:-len(".opus")], st.st_size))
+        for _, vid, size in sorted(found):
+            self._files[vid] = size
+            self._total += size
+
+    def _path(self, vid: str) -> str:
+        return os.path.join(self.directory, vid + ".opus")
+
+    def path_for(self, track: Track) -> Optional[str]:
+        vid = youtube_video_id(track.url)
+        if not vid or vid not in self._files:
+            return None
+        path = self._path(vid)
+        if not os.path.exists(path):
+            self._forget(vid)
+            return None
+        self._files.move_to_end(vid)
+        try:
+            # 재시작 후에도 LRU 순서가 유지되게 수정 시각 갱신
+            os.utime(path)
+        except OSError:
+            pass
+        return path
+
+    def has(self, track: Track) -> bool:
+        vid = youtube_video_id(track.url)
+        return bool(vid) and vid in self._files
+
+    def _forget(self, vid: str):
+        size = self._files.pop(vid, None)
+        if size is not None:
+            self._total -= size
+
+    def discard(self, track: Track):
+        vid = youtube_video_id(track.url)
+        if not vid:
+            return
+        self._forget(vid)
+        try:
+            os.remove(self._path(vid))
+        except OSError:
+            pass
+
+    def note_play(self, track: Track):
+        """
+        출력: 재생 횟수 +1, 기준을 넘으면 백그라운드 변환 예약
+        """
+        vid = youtube_video_id(track.url)
+        if not vid or vid in self._files or vid in self._jobs:
+            return
+
+        count = self._plays.pop(vid, 0) + 1
+        self._plays[vid] = count
+        while len(self._plays) > AUDIO_CACHE_COUNT_TRACKED:
+            self._plays.popitem(last=False)
+
+        if count < self.min_plays or not track.stream_url:
+            return
+        if track.duration is None or track.duration > AUDIO_CACHE_MAX_TRACK_SEC:
+            return
+        self._jobs[vid] = asyncio.create_task(self._store(vid, track.stream_url))
+
+    async def _store(self, vid: str, stream_url: str):
+        final = self._path(vid)
+        part = final + ".part"
+        codec = ["-c:a", "copy"] if stream_codec_hint(stream_url) == "opus" else ["-c:a", "libopus", "-b:a", "128k"]
+        try:
+            async with self._sem:
+                proc = await asyncio.create_subprocess_exec(
+                    "ffmpeg", "-nostdin", "-loglevel", "error", "-y",
+                    *FFMPEG_OPTIONS["before_options"].split(),
+                    "-i", stream_url,
+                    "-vn", *codec, "-f", "opus", part,
+                    stdout=asyncio.subprocess.DEVNULL,
+                    stderr=asyncio.subprocess.PIPE,
+                )
+                _, err = await proc.communicate()
+            if proc.returncode != 0:
+                raise Exception((err or b"").decode(errors="ignore").strip() or f"ffmpeg 종료 코드 {proc.returncode}")
+
+            os.replace(part, final)
+            size = os.path.getsize(final)
+            self._files[vid] = size
+            self._total += size
+            self._plays.pop(vid, None)
+            self._evict()
+            print(f"[오디오 캐시] 저장: {vid} ({size // 1024}KB)", flush=True)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print("[오디오 캐시] 저장 실패:", vid, repr(e), flush=True)
+        finally:
+            self._jobs.pop(vid, None)
+            if os.path.exists(part):
+                try:
+                    os.remove(part)
+                except OSError:
+                    pass
+
+    def _evict(self):
+        while self._total > self.max_bytes and self._files:
+            vid, size = self._files.popitem(last=False)
+            self._total -= size
+            try:
+                os.remove(self._path(vid))
+            except OSError:
+                pass
+
+
+audio_cache: Optional[AudioCache] = None
+if AUDIO_CACHE_DIR and multiprocessing.parent_process() is None:
+    try:
+        audio_cache = AudioCache(AUDIO_CACHE_DIR, AUDIO_CACHE_MAX_MB * 1024 * 1024, AUDIO_CACHE_MIN_PLAYS)
+    except Exception as e:
+        print("오디오 캐시 열기 실패(끄고 진행):", repr(e), flush=True)
+        audio_cache = None
+
+# ==============================
+# ✅ 오디오 소스 생성 (Opus 패스스루 우선, 안 되면 PCM)
+# ==============================
+class TrackedSource(discord.AudioSource):
+    """
+    AudioSource 래퍼.
+    - 읽은 프레임 수(1프레임 = 20ms)를 세서 재생 위치를 알 수 있음
+    - 첫 패킷이 나오는 순간 on_first_packet() 호출(오디오 스레드에서 불림)
+    """
+    FRAME_SEC = 0.02
+
+    def __init__(self, inner: discord.AudioSource, on_first_packet: Optional[Callable[[], None]] = None):
+        self.inner = inner
+        self.frames = 0
+        self._on_first_packet = on_first_packet
+        # 이 소스로 재생될 길이(초). 모르면 None
+        self.expected_sec: Optional[float] = None
+        self._primed: Optional[bytes] = None
+
+    def prime(self):
+        """
+        출력: 첫 패킷을 미리 읽어 둠(ffmpeg 기동 + 첫 바이트 대기를 재생 전에 끝냄). 스레드에서 호출
+        """
+        if self._primed is None:
+            self._primed = self.inner.read()
+
+    def read(self) -> bytes:
+        if self._primed is not None:
+            data, self._primed = self._primed, None
+        else:
+            data = self.inner.read()
+        if data:
+            if self.frames == 0 and self._on_first_packet is not None:
+                cb = self._on_first_packet
+                self._on_first_packet = None
+                try:
+                    cb()
+                except Exception:
+                    pass
+            self.frames += 1
+        return data
+
+    def is_opus(self) -> bool:
+        return self.inner.is_opus()
+
+    def cleanup(self):
+        self.inner.cleanup()
+
+    @property
+    def position_sec(self) -> float:
+        return self.frames * self.FRAME_SEC
+
+    @property
+    def _current_error(self) -> Optional[Exception]:
+        # AudioPlayer가 read()가 비었을 때 ffmpeg 에러를 after로 넘기려고 봄
+        return getattr(self.inner, "_current_error", None)
+
+    def frames_left(self) -> Optional[int]:
+        if self.expected_sec is None:
+            return None
+        return int((self.expected_sec - self.position_sec) / self.FRAME_SEC)
+
+    def cut_short(self) -> bool:
+        """
+        출력값: 에러로 끝났거나 예상 길이보다 MIDTRACK_END_SLACK_SEC 넘게 일찍 끝났으면 True
+        """
+        if self._current_error is not None:
+            return True
+        return self.expected_sec is not None and self.position_sec < self.expected_sec - MIDTRACK_END_SLACK_SEC
+
+def stream_codec_hint(stream_url: str) -> Optional[str]:
+    """
+    입력값: 스트림 URL
+    출력값: "opus" | "other" | None(모름 -> ffprobe로 확인)
+    - googlevideo URL의 itag/mime 파라미터로 판단(추가 네트워크 요청 없음)
+    """
+    params = parse_qs(urlparse(stream_url).query)
+    itag = (params.get("itag") or [""])[0]
+    if itag in YOUTUBE_OPUS_ITAGS:
+        return "opus"
+    mime = (params.get("mime") or [""])[0]
+    if mime.startswith("audio/webm"):
+        return "opus"
+    if mime or itag:
+        return "other"
+    return None
+
+# ==============================
+# ✅ ffmpeg 소스 만들기(봇 프로세스/음성 작업 프로세스 공용)
+# ==============================
+def ffmpeg_source_spec(track: Track, local_path: Optional[str] = None, start_sec: float = 0.0) -> dict:
+    """
+    입력값: track, local_path, start_sec (make_audio_source와 같음)
+    출력값: {"path", "opus": "copy"|"encode"|"probe"|None(PCM), "before", "options"} (JSON으로 넘길 수 있는 값만)
+    """
+    seek = f"-ss {start_sec:.2f}" if start_sec > 0 else ""
+    before = " ".join(x for x in (seek, FFMPEG_OPTIONS["before_options"]) if x)
+
+    if local_path:
+        return {
+            "path": local_path,
+            "opus": "copy" if PLAYBACK_MODE == "opus" else None,
+            "before": seek or None,
+            "options": "-vn",
+        }
+
+    opus = None
+    if PLAYBACK_MODE == "opus":
+        hint = stream_codec_hint(track.stream_url)
+        opus = "copy" if hint == "opus" else ("probe" if hint is None else "encode")
+    return {"path": track.stream_url, "opus": opus, "before": before, "options": FFMPEG_OPUS_OPTIONS["options"]}
+
+def open_ffmpeg_source(spec: dict) -> discord.AudioSource:
+    """
+    입력값: ffmpeg_source_spec() 결과
+    출력값: AudioSource ("probe"는 ffprobe 없이 ffmpeg 안에서 Opus로 인코딩)
+    - Opus 소스를 못 만들면 PCM으로 대체
+    """
+    if spec["opus"]:
+        try:
+            return discord.FFmpegOpusAudio(
+                spec["path"],
+                codec="copy" if spec["opus"] == "copy" else None,
+                before_options=spec["before"],
+                options=spec["options"],
+            )
+        except Exception as e:
+            print("Opus 소스 생성 실패, PCM으로 재생:", repr(e), flush=True)
+    return discord.FFmpegPCMAudio(spec["path"], before_options=spec["before"], options=FFMPEG_OPTIONS["options"])
+
+# ==============================
+# ✅ 음성 작업 프로세스(ffmpeg 관리/ogg 분해/Opus 인코딩을 봇 프로세스 밖에서)
+# ==============================
+# 봇 -> 작업자: JSON 한 덩어리 {"op": "open"|"credit"|"close"|"stop", "sid": 스트림 번호, ...}
+# 작업자 -> 봇: [종류 1바이트][스트림 번호 4바이트][내용]
+VW_PACKET = 1  # 내용 = Opus 패킷 하나(20ms)
+VW_END = 2     # 내용 = 에러 문구(정상 종료면 비어 있음)
+_VW_HEAD = struct.Struct(">BI")
+
+
+class _WorkerStream(threading.Thread):
+    """
+    작업자 안의 스트림 하나. 봇이 허락한 패킷 수(credit)만큼만 읽어서 보냄
+    -> 봇이 일시정지하면 여기서도 멈추고, ffmpeg도 파이프가 차서 멈춤(프로세스 안에서 재생할 때와 같음)
+    """
+    def __init__(self, sid: int, spec: dict, open_source: Callable[[dict], discord.AudioSource], send: Callable[..., None]):
+        super().__init__(daemon=True, name=f"voice-stream-{sid}")
+        self.sid = sid
+        self.spec = spec
+        self.open_source = open_source
+        self.send = send
+        self.credit = 0
+        self.closed = False
+        self.cond = threading.Condition()
+
+    def grant(self, n: int):
+        with self.cond:
+            self.credit += n
+            self.cond.notify()
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+
+    def run(self):
+        source = None
+        error = ""
+        try:
+            source = self.open_source(self.spec)
+            encoder = None if source.is_opus() else discord.opus.Encoder()
+            while True:
+                with self.cond:
+                    while self.credit <= 0 and not self.closed:
+                        self.cond.wait()
+                    if self.closed:
+                        return
+                    self.credit -= 1
+                data = source.read()
+                if not data:
+                    err = getattr(source, "_current_error", None)
+                    error = repr(err) if err else ""
+                    break
+                if encoder is not None:
+                    data = encoder.encode(data, encoder.SAMPLES_PER_FRAME)
+                self.send(VW_PACKET, self.sid, data)
+        except Exception as e:
+            error = repr(e)
+        finally:
+            if source is not None:
+                source.cleanup()
+        self.send(VW_END, self.sid, error.encode("utf-8"))
+
+def resolve_source_opener(ref: str) -> Callable[[dict], discord.AudioSource]:
+    """
+    입력값: ref("모듈:함수", 비우면 ffmpeg)
+    출력값: spec -> AudioSource 함수(작업자 안에서 소스를 열 때 씀)
+    """
+    if not ref:
+        return open_ffmpeg_source
+    import importlib
+    module, _, name = ref.partition(":")
+    return getattr(importlib.import_module(module), name)
+
+def voice_worker_serve(conn, open_source: Callable[[dict], discord.AudioSource] = open_ffmpeg_source):
+    """
+    입력값: conn(multiprocessing Connection), open_source(spec -> AudioSource, 확인용 대역으로 바꿀 수 있음)
+    출력: 연결이 끊기거나 "stop"을 받을 때까지 스트림 요청 처리(스트림마다 스레드 하나)
+    - 끝날 때 연결을 닫음(스레드 모드도 프로세스가 끝날 때처럼 봇 쪽이 종료를 알아챔)
+    """
+    streams: Dict[int, _WorkerStream] = {}
+    send_lock = threading.Lock()
+
+    def send(kind: int, sid: int, payload: bytes = b""):
+        try:
+            with send_lock:
+                conn.send_bytes(_VW_HEAD.pack(kind, sid) + payload)
+        except (OSError, EOFError, ValueError):
+            pass
+
+    try:
+        while True:
+            try:
+                msg = json.loads(conn.recv_bytes())
+            except (EOFError, OSError):
+                break
+            op = msg.get("op")
+            sid = msg.get("sid", 0)
+            if op == "open":
+                stream = streams[sid] = _WorkerStream(sid, msg["spec"], open_source, send)
+                stream.grant(msg.get("credit", VOICE_WORKER_BUFFER_PACKETS))
+                stream.start()
+            elif op == "credit":
+                stream = streams.get(sid)
+                if stream is not None:
+                    stream.grant(msg["n"])
+            elif op == "close":
+                stream = streams.pop(sid, None)
+                if stream is not None:
+                    stream.close()
+            elif op == "stop":
+                break
+    finally:
+        with send_lock:
+            try:
+                conn.close()
+            except OSError:
+                pass
+        for stream in streams.values():
+            stream.close()
+
+def voice_worker_main(conn, source_ref: str = ""):
+    # 작업 프로세스 진입점(spawn이라 모듈 최상위 함수여야 함)
+    voice_worker_serve(conn, resolve_source_opener(source_ref))
+
+def spawn_voice_worker_process(index: int, source_ref: Optional[str] = None):
+    ctx = multiprocessing.get_context("spawn")
+    parent, child = ctx.Pipe(duplex=True)
+    ref = VOICE_WORKER_SOURCE if source_ref is None else source_ref
+    proc = ctx.Process(target=voice_worker_main, args=(child, ref), name=f"voice-worker-{index}", daemon=True)
+    proc.start()
+    child.close()
+    return parent, proc
+
+def spawn_voice_worker_thread(index: int, open_source: Optional[Callable[[dict], discord.AudioSource]] = None):
+    """
+    입력값: index, open_source(없으면 VOICE_WORKER_SOURCE 설정대로)
+    출력값: (봇 쪽 연결, 스레드) - 프로세스 대신 스레드에서 같은 프로토콜을 돌림
+    """
+    open_source = open_source or resolve_source_opener(VOICE_WORKER_SOURCE)
+    parent, child = multiprocessing.Pipe(duplex=True)
+    thread = threading.Thread(target=voice_worker_serve, args=(child, open_source), name=f"voice-worker-{index}", daemon=True)
+    thread.start()
+    return parent, thread
+
+
+class RemoteOpusSource(discord.AudioSource):
+    """
+    작업자가 보내 주는 Opus 패킷을 그대로 내보내는 소스(봇 프로세스는 디코딩/인코딩/ogg 분해 안 함)
+    - read()는 오디오 스레드에서 불림. 패킷이 아직 없으면 올 때까지 기다림
+    - 작업자가 끝 알림에 에러를 실어 보내거나 작업자가 죽으면 _current_error로 넘김(-> 중간 끊김 복구)
+    """
+    def __init__(self, pool: "VoiceWorkerPool", worker: "VoiceWorker", sid: int, guild_id: int):
+        self.pool = pool
+        self.worker = worker
+        self.sid = sid
+        self.guild_id = guild_id
+        self._packets: Deque[bytes] = deque()
+        self._cond = threading.Condition()
+        self._ended = False
+        self._current_error: Optional[Exception] = None
+        self._consumed = 0
+        self._closed = False
+
+    def feed(self, data: bytes):
+        with self._cond:
+            self._packets.append(data)
+            self._cond.notify()
+
+    def finish(self, error: str = ""):
+        with self._cond:
+            self._ended = True
+            if error and self._current_error is None:
+                self._current_error = Exception(error)
+            self._cond.notify()
+
+    def read(self) -> bytes:
+        with self._cond:
+            if not self._packets and not self._ended:
+                self._cond.wait_for(lambda: self._packets or self._ended, VOICE_WORKER_STALL_SEC)
+            if not self._packets:
+                if not self._ended and self._current_error is None:
+                    self._current_error = Exception("음성 작업 프로세스 응답 없음")
+                return b""
+            data = self._packets.popleft()
+        self._consumed += 1
+        if self._consumed >= VOICE_WORKER_CREDIT_STEP:
+            self.worker.send({"op": "credit", "sid": self.sid, "n": self._consumed})
+            self._consumed = 0
+        return data
+
+    def is_opus(self) -> bool:
+        return True
+
+    def cleanup(self):
+        if not self._closed:
+            self._closed = True
+            self.pool.release(self)
+
+
+class VoiceWorker:
+    """
+    봇 쪽에서 본 작업자 하나: 연결 + 받은 패킷을 스트림별로 나눠 주는 수신 스레드
+    """
+    def __init__(self, index: int, conn, handle):
+        self.index = index
+        self.conn = conn
+        self.handle = handle
+        self.streams: Dict[int, RemoteOpusSource] = {}
+        self.alive = True
+        self._send_lock = threading.Lock()
+        self._reader = threading.Thread(target=self._read_loop, name=f"voice-worker-{index}-reader", daemon=True)
+        self._reader.start()
+
+    def send(self, msg: dict):
+        try:
+            with self._send_lock:
+                self.conn.send_bytes(json.dumps(msg, separators=(",", ":")).encode("utf-8"))
+        except (OSError, EOFError, ValueError):
+            self.alive = False
+
+    def _read_loop(self):
+        while True:
+            try:
+                raw = self.conn.recv_bytes()
+            except (EOFError, OSError):
+                break
+            kind, sid = _VW_HEAD.unpack_from(raw)
+            source = self.streams.get(sid)
+            if source is None:
+                continue
+            if kind == VW_PACKET:
+                source.feed(raw[_VW_HEAD.size:])
+            elif kind == VW_END:
+                source.finish(raw[_VW_HEAD.size:].decode("utf-8", "replace"))
+        self.alive = False
+        for source in list(self.streams.values()):
+            source.finish("음성 작업 프로세스 종료")
+
+    def stop(self):
+        self.send({"op": "stop"})
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+        if isinstance(self.handle, multiprocessing.process.BaseProcess):
+            self.handle.join(timeout=2)
+            if self.handle.is_alive():
+                self.handle.terminate()
+
 
-    async with music.lock:
-        music.queue.clear()
-        music.now_playing = None
-        music.skip_flag = False
-        music.is_busy = False
-        music.playlist_task = None
+class VoiceWorkerPool:
+    """
+    음성 작업자 N개.
+    - 길드는 처음 소스를 열 때 열린 스트림이 가장 적은 작업자에 붙고, 그 길드 스트림이 남아 있는 동안 같은 작업자를 씀
+      (미리 띄운 다음 곡도 같은 작업자 -> 길드 하나가 작업자 둘을 붙잡지 않음)
+    - 작업자가 죽으면 그 스트림들은 에러로 끝나고(중간 끊김 복구가 다른 작업자로 이어 재생), 다음에 고를 때 새로 띄움
+    """
+    def __init__(self, size: int, spawn: Callable[[int], Tuple[Any, Any]]):
+        self.size = size
+        self._spawn = spawn
+        self._workers: List[Optional[VoiceWorker]] = [None] * size
+        self._guild_worker: Dict[int, VoiceWorker] = {}
+        self._lock = threading.Lock()
+        self._sids = itertools.count(1)
+
+    def _worker(self, index: int) -> VoiceWorker:
+        worker = self._workers[index]
+        if worker is None or not worker.alive:
+            if worker is not None:
+                M_VOICE_WORKER_RESTARTS.inc()
+                print(f"[음성 작업자 {index}] 종료됨 -> 다시 띄움", flush=True)
+            conn, handle = self._spawn(index)
+            worker = self._workers[index] = VoiceWorker(index, conn, handle)
+        return worker
+
+    def start(self):
+        """출력: 작업자 전부 미리 띄움(스레드에서 호출, 첫 곡이 프로세스 기동을 기다리지 않게)"""
+        with self._lock:
+            for i in range(self.size):
+                self._worker(i)
+
+    def _pick(self, guild_id: int) -> VoiceWorker:
+        worker = self._guild_worker.get(guild_id)
+        if worker is not None and worker.alive:
+            return worker
+        workers = [self._worker(i) for i in range(self.size)]
+        worker = min(workers, key=lambda w: (len(w.streams), w.index))
+        self._guild_worker[guild_id] = worker
+        return worker
+
+    def open(self, guild_id: int, spec: dict) -> RemoteOpusSource:
+        with self._lock:
+            worker = self._pick(guild_id)
+            sid = next(self._sids)
+            source = worker.streams[sid] = RemoteOpusSource(self, worker, sid, guild_id)
+        worker.send({"op": "open", "sid": sid, "spec": spec, "credit": VOICE_WORKER_BUFFER_PACKETS})
+        if not worker.alive:
+            source.finish("음성 작업 프로세스 종료")
+        return source
+
+    def release(self, source: RemoteOpusSource):
+        worker = source.worker
+        with self._lock:
+            worker.streams.pop(source.sid, None)
+            if self._guild_worker.get(source.guild_id) is worker and not any(
+                s.guild_id == source.guild_id for s in worker.streams.values()
+            ):
+                del self._guild_worker[source.guild_id]
+        worker.send({"op": "close", "sid": source.sid})
+
+    def load(self) -> List[int]:
+        return [len(w.streams) if w is not None else 0 for w in self._workers]
+
+    def close(self):
+        for worker in self._workers:
+            if worker is not None:
+                worker.stop()
+
+
+voice_workers: Optional[VoiceWorkerPool] = None
+if VOICE_WORKERS > 0:
+    voice_workers = VoiceWorkerPool(
+        VOICE_WORKERS,
+        spawn_voice_worker_thread if VOICE_WORKER_MODE == "thread" else spawn_voice_worker_process,
+    )
+    atexit.register(voice_workers.close)
 
-    # 음성 채널 연결 해제
-    try:
-        if vc and vc.is_connected():
-            await vc.disconnect()
-    except Exception:
-        pass
+metrics.gauge(
+    "bot_voice_worker_streams", "open audio streams per voice worker", ("worker",),
+    lambda: [((str(i),), n) for i, n in enumerate(voice_workers.load())] if voice_workers else [],
+)
 
-    # 태스크 정리(자기 자신은 취소하지 않음)
-    if music.player_task and not music.player_task.done() and music.player_task is not current:
-        music.player_task.cancel()
+async def make_audio_source(
+    track: Track, local_path: Optional[str] = None, start_sec: float = 0.0, guild_id: int = 0
+) -> discord.AudioSource:
+    """
+    입력값: track(stream_url 준비된 곡), local_path(로컬 캐시 파일이 있으면 그 경로), start_sec(이어 재생 위치), guild_id
+    출력값: AudioSource
+    - 로컬 캐시 파일: 이미 Opus라서 그대로 전달(네트워크/재연결 옵션 없음)
+    - Opus 원본: ffmpeg가 -c:a copy로 ogg/opus 패킷만 넘김(디코딩/재인코딩 없음)
+    - 다른 코덱: ffmpeg 안에서 Opus로 인코딩(봇 프로세스는 인코딩 안 함)
+    - Opus 소스를 못 만들면 PCM으로 대체
+    - start_sec > 0이면 입력 쪽 -ss로 그 위치부터 받음(앞부분을 내려받지 않음)
+    - ✅ VOICE_WORKERS > 0이면 길드에 배정된 음성 작업자가 위 과정을 맡고 Opus 패킷만 받아 옴
+    """
+    spec = ffmpeg_source_spec(track, local_path, start_sec)
+    if voice_workers is not None:
+        return voice_workers.open(guild_id, spec)
 
-    if music.idle_task and not music.idle_task.done() and music.idle_task is not current:
-        music.idle_task.cancel()
+    if spec["opus"] == "probe":
+        try:
+            return await discord.FFmpegOpusAudio.from_probe(
+                spec["path"], before_options=spec["before"], options=spec["options"]
+            )
+        except Exception as e:
+            print("Opus 소스 생성 실패, PCM으로 재생:", repr(e), flush=True)
+            spec = {**spec, "opus": None}
+    return open_ffmpeg_source(spec)
 
-    # 패널 삭제는 취소 영향 받지 않게 보호
-    try:
-        await asyncio.shield(delete_panel(guild, music))
-    except Exception:
-        pass
+def ended_abnormally(track: Track, played_sec: float, error: Optional[Exception]) -> bool:
+    """
+    입력값: track, played_sec(실제로 내보낸 위치), error(after 콜백 에러)
+    출력값: 곡 끝까지 못 가고 끊겼으면 True (길이를 모르는 곡은 에러가 있을 때만)
+    """
+    if error is not None:
+        return True
+    if not track.duration:
+        return False
+    return played_sec < track.duration - MIDTRACK_END_SLACK_SEC
 
 # ==============================
-# 유휴 감시
+# ✅ 끊김 없는 곡 전환(다음 곡 미리 띄우기 + 이어 붙이기)
 # ==============================
-async def idle_watcher(guild: discord.Guild, music: GuildMusic):
-    try:
-        while True:
-            await asyncio.sleep(2)
-
-            vc = guild.voice_client
-            if not vc or not vc.is_connected():
-                return
+@dataclass
+class Handoff:
+    track: Track
+    replay: bool  # 반복 재생이라 대기열 곡이 아님
+    queued: Optional[Track] = None  # 대기열 맨 앞에 있는 원래 항목(넘어가는 순간 뺌)
+    plan: Optional[Callable[[], bool]] = None  # 준비한 뒤 대기열/반복 모드가 그대로면 True
+    source: Optional["TrackedSource"] = None  # 준비 끝나면 채워짐
+    local_path: Optional[str] = None
+    switch_ts: float = 0.0
+    gap_sec: Optional[float] = None  # 앞 곡 마지막 패킷 -> 이 곡 첫 패킷
+
+class ChainedSource(discord.AudioSource):
+    """
+    vc.play 한 번으로 여러 곡을 이어 보내는 소스
+    - 지금 곡이 다 끝나는 순간(read가 b"") 준비해 둔 다음 곡으로 바로 넘어가고 notify() 호출(오디오 스레드)
+    - 지금 곡이 중간에 끊긴 경우는 넘어가지 않고 끝냄(재생 루프가 이어 재생 처리)
+    - CROSSFADE_SEC > 0이고 두 곡 모두 PCM이면 끝부분을 섞어서 보냄
+    """
+    def __init__(self, first: "TrackedSource", notify: Callable[[], None]):
+        self.current = first
+        self._notify = notify
+        self._lock = threading.Lock()
+        self._staged: Optional[Handoff] = None
+        self._switched: Deque[Handoff] = deque()
+        self.ended = False
+        self.errors: List[Exception] = []
+        self._last_packet_ts: Optional[float] = None
+        self._fade_frames = int(CROSSFADE_SEC / TrackedSource.FRAME_SEC)
+        # vc.play는 처음 소스 기준으로만 인코더를 준비하므로 Opus/PCM이 바뀌는 곡은 이어 붙이지 않음
+        self._opus = first.is_opus()
+
+    def stage(self, handoff: Handoff) -> bool:
+        with self._lock:
+            if self.ended or self._staged is not None:
+                return False
+            self._staged = handoff
+            return True
+
+    def arm(self, handoff: Handoff, source: "TrackedSource") -> bool:
+        with self._lock:
+            if self._staged is not handoff or self.ended:
+                return False
+            handoff.source = source
+            return True
+
+    def unstage(self) -> Optional[Handoff]:
+        with self._lock:
+            handoff, self._staged = self._staged, None
+            return handoff
+
+    def take_switch(self) -> Optional[Handoff]:
+        with self._lock:
+            return self._switched.popleft() if self._switched else None
+
+    def finish(self, error: Optional[Exception]):
+        with self._lock:
+            self.ended = True
+            if error:
+                self.errors.append(error)
+
+    def _crossfade(self, cur: "TrackedSource", data: bytes) -> bytes:
+        staged = self._staged
+        nxt = staged.source if staged is not None else None
+        if nxt is None or cur.is_opus() or nxt.is_opus():
+            return data
+        left = cur.frames_left()
+        if left is None:
+            return data
+        left += 1  # 방금 읽은 프레임 포함
+        if left <= 0 or left > self._fade_frames:
+            return data
+        incoming = nxt.read()
+        if not incoming:
+            return data
+        if len(incoming) != len(data):
+            incoming = incoming[:len(data)].ljust(len(data), b"\0")
+        out_gain = (left - 0.5) / self._fade_frames
+        return audioop.add(audioop.mul(data, 2, out_gain), audioop.mul(incoming, 2, 1.0 - out_gain), 2)
+
+    def read(self) -> bytes:
+        cur = self.current
+        data = cur.read()
+        if data:
+            self._last_packet_ts = time.monotonic()
+            if self._fade_frames:
+                with self._lock:
+                    data = self._crossfade(cur, data)
+            return data
+
+        with self._lock:
+            handoff = self._staged
+            if handoff is None or handoff.source is None or cur.cut_short() or handoff.source.is_opus() != self._opus:
+                return b""
+            if handoff.plan is not None and not handoff.plan():
+                # 준비 뒤 대기열/반복 모드가 바뀜 -> 여기서 끝내고 재생 루프가 새로 고름
+                return b""
+            self._staged = None
+            self.current = handoff.source
+        cur.cleanup()
+        data = self.current.read()
+        handoff.switch_ts = time.monotonic()
+        if data and self._last_packet_ts is not None:
+            handoff.gap_sec = handoff.switch_ts - self._last_packet_ts
+            self._last_packet_ts = handoff.switch_ts
+        with self._lock:
+            self._switched.append(handoff)
+        self._notify()
+        return data
+
+    def is_opus(self) -> bool:
+        return self.current.is_opus()
+
+    def cleanup(self):
+        self.current.cleanup()
+        staged = self._staged
+        if staged is not None and staged.source is not None:
+            staged.source.cleanup()
+
+    @property
+    def _current_error(self) -> Optional[Exception]:
+        return self.current._current_error
+
+async def prespawn_next(guild: discord.Guild, music: GuildMusic, chain: ChainedSource, current: Track, current_src: "TrackedSource"):
+    """
+    - 지금 곡이 GAPLESS_PRESPAWN_SEC(크로스페이드면 그보다 길게) 남으면 대기열 맨 앞 곡(빼지 않고 보기만)의
+      스트림 준비 + ffmpeg 기동 + 첫 패킷까지 읽어 두고 chain에 붙임
+    - 곡은 넘어가는 순간 재생 루프가 대기열에서 뺌(그 전까지 /목록, /취소 번호 그대로)
+    - 준비한 뒤 대기열/반복 모드가 바뀌면(music.plan_changed) 준비한 곡을 버리고 다시 고름
+    - 폴링 없음: 남은 시간만큼 한 번에 자고 다시 계산(일시정지면 위치가 안 늘어서 한 번 더 잘 뿐)
+    """
+    if current_src.expected_sec is None:
+        return
+    lead = max(GAPLESS_PRESPAWN_SEC, CROSSFADE_SEC + 1.0)
+    while True:
+        left = current_src.expected_sec - current_src.position_sec
+        if left <= lead:
+            break
+        # 재생 위치는 실제 시간보다 빨리 늘지 않으므로 그 전에 깰 필요가 없음
+        await asyncio.sleep((left - lead) / PLAYBACK_CLOCK_RATE)
 
-            if vc.is_playing() or vc.is_paused():
-                continue
+    while True:
+        music.plan_changed.clear()
+        version, mode = music.queue.version, music.repeat_mode
 
-            async with music.lock:
-                has_queue = bool(music.queue)
-                has_now = (music.now_playing is not None)
+        def plan(version=version, mode=mode) -> bool:
+            return music.queue.version == version and music.repeat_mode == mode
 
-            if has_queue or has_now:
-                continue
+        if mode == "one" or (mode == "all" and not music.queue):
+            handoff = Handoff(current, replay=True, plan=plan)
+        elif music.queue:
+            head = music.queue[0]
+            handoff = Handoff(head, replay=False, queued=head, plan=plan)
+        else:
+            handoff = None
 
-            elapsed = time.monotonic() - music.last_command_ts
-            if elapsed < IDLE_TIMEOUT_SEC:
-                continue
+        if handoff is not None:
+            if not chain.stage(handoff):
+                return
+            if not await prepare_handoff(music, chain, handoff):
+                return
 
-            await do_leave(guild, music)
-            return
+        # ✅ 대기열/반복 모드가 바뀌면 준비한 곡을 버리고 다시 고름(이미 넘어갔으면 끝)
+        while plan():
+            await music.plan_changed.wait()
+            music.plan_changed.clear()
+        if handoff is not None:
+            if chain.unstage() is not handoff:
+                return
+            if handoff.source is not None:
+                handoff.source.cleanup()
 
+async def prepare_handoff(music: GuildMusic, chain: ChainedSource, handoff: Handoff) -> bool:
+    """
+    입력값: music, chain, handoff(chain에 stage된 것)
+    출력값: 첫 패킷까지 준비해서 chain에 붙였으면 True(실패하면 stage를 풀고 False)
+    """
+    source = None
+    try:
+        spawn_ts = time.monotonic()
+        track = handoff.track
+        handoff.local_path = audio_cache.path_for(track) if audio_cache is not None else None
+        if handoff.local_path is None:
+            track = handoff.track = await ensure_stream_ready(track, music)
+        source = TrackedSource(await make_audio_source(track, handoff.local_path, guild_id=music.guild_id))
+        source.expected_sec = float(track.duration) if track.duration else None
+        await asyncio.to_thread(source.prime)
+        M_FIRST_AUDIO_SECONDS.observe(time.monotonic() - spawn_ts, source="prespawn")
+        if chain.arm(handoff, source):
+            return True
+        source.cleanup()
+        return False
     except asyncio.CancelledError:
-        return
-
-def ensure_idle_task(guild: discord.Guild, music: GuildMusic):
-    if music.idle_task and not music.idle_task.done():
-        return
-    music.idle_task = asyncio.create_task(idle_watcher(guild, music))
-
-# ==============================
-# ✅ 재생 직전 지연 추출
-# ==============================
-async def ensure_stream_ready(track: Track) -> Track:
-    if track.stream_url:
-        return track
-    new = await extract_with_retry_single(track.url)
-    new.requester = track.requester
-    return new
+        if source is not None:
+            source.cleanup()
+        raise
+    except Exception as e:
+        print("[끊김 없는 재생] 다음 곡 준비 실패:", repr(e), flush=True)
+        if source is not None:
+            source.cleanup()
+        chain.unstage()
+        return False
 
 # ==============================
-# 재생 루프 (✅ 즉시 실패 시 1회 재추출 후 재시도)
+# 재생 루프 (✅ 즉시 실패 시 1회 재추출 후 재시도, 중간 끊김은 끊긴 위치부터 이어 재생)
 # ==============================
 async def player_loop(guild: discord.Guild, music: GuildMusic):
+    handoff: Optional[Handoff] = None  # 앞 곡이 끝나는 순간 이미 이어서 재생 중인 곡
+    chain: Optional[ChainedSource] = None
     while True:
-        music.next_event.clear()
+        if handoff is None:
+            music.next_event.clear()
 
-        async with music.lock:
             if not music.queue:
                 music.now_playing = None
+                music.track_end_ts = None
 
-        while True:
-            async with music.lock:
-                if music.queue:
-                    break
-            await asyncio.sleep(0.5)
+            # ✅ 곡이 들어오는 순간 깨어남(append/appendleft가 이벤트를 세움)
+            await music.queue.wait_for_item()
 
-        async with music.lock:
+            if not music.queue:
+                # 기다리는 사이 취소/퇴장으로 비워졌으면 다시 대기
+                continue
             track = music.queue.popleft()
             music.now_playing = track
+            schedule_prefetch(music)
+        else:
+            track = handoff.track
+            music.now_playing = track
+            schedule_prefetch(music)
 
         vc = guild.voice_client
         if not vc or not vc.is_connected():
@@ -782,106 +3755,580 @@ async def player_loop(guild: discord.Guild, music: GuildMusic):
 
         # 재생 시도(즉시 실패면 1회만 재추출 후 재시도)
         attempts_left = EARLY_FAIL_RETRY + 1  # 기본 1회 + 재시도 1회
+        recoveries_left = MIDTRACK_RECOVERY_ATTEMPTS
+        resume_at = 0.0  # 중간에 끊겼다가 이어 재생할 때 시작 위치(초)
+        # ✅ 재시작 전에 듣던 곡이면 저장된 위치부터
+        if music.restore_offset is not None and music.restore_offset[0] is track:
+            resume_at = music.restore_offset[1]
+        music.restore_offset = None
+        music.play_source = None
         while attempts_left > 0:
             attempts_left -= 1
 
-            try:
-                track = await ensure_stream_ready(track)
-                async with music.lock:
+            if handoff is not None:
+                # ✅ 미리 띄워 둔 소스로 이미 넘어감(vc.play/ffmpeg 기동 없음)
+                source, local_path, start_ts = handoff.source, handoff.local_path, handoff.switch_ts
+                music.track_end_ts = None
+                music.play_source, music.play_offset = source, 0.0
+                if handoff.gap_sec is not None:
+                    M_TRACK_GAP_SECONDS.observe(handoff.gap_sec)
+                handoff = None
+                print(f"[재생 시작] {track.title} (끊김 없이 이어짐)", flush=True)
+                if audio_cache is not None and not local_path:
+                    audio_cache.note_play(track)
+                await upsert_panel(guild, music)
+            else:
+                try:
+                    # ✅ 캐시 파일 경로를 먼저 잡고, 없을 때만 스트림 준비(그사이 파일이 지워져도 stream_url 없이 재생하지 않음)
+                    local_path = audio_cache.path_for(track) if audio_cache is not None else None
+                    if local_path is None:
+                        track = await ensure_stream_ready(track, music)
                     music.now_playing = track
-            except Exception as e:
-                print("재생 직전 추출 실패:", repr(e), flush=True)
-                bot.loop.call_soon_threadsafe(music.next_event.set)
-                break
+                except Exception as e:
+                    print("재생 직전 추출 실패:", repr(e), flush=True)
+                    if not music.queue:
+                        music.now_playing = None
+                        touch_command(music)
+                    bot.loop.call_soon_threadsafe(music.next_event.set)
+                    break
+
+                start_ts = time.monotonic()
+
+                gap_from = music.track_end_ts
+                music.track_end_ts = None
 
-            start_ts = time.monotonic()
+                kind = "resume" if resume_at > 0 else "cache" if local_path else "stream"
 
-            source = discord.FFmpegPCMAudio(track.stream_url, **FFMPEG_OPTIONS)
+                def on_first_packet(spawn_ts=time.monotonic(), gap_from=gap_from, kind=kind):
+                    now = time.monotonic()
+                    M_FIRST_AUDIO_SECONDS.observe(now - spawn_ts, source=kind)
+                    if gap_from is not None and kind != "resume":
+                        M_TRACK_GAP_SECONDS.observe(now - gap_from)
 
-            def after_play(error):
-                if error:
-                    print("재생 after 에러:", repr(error), flush=True)
-                bot.loop.call_soon_threadsafe(music.next_event.set)
+                source = TrackedSource(
+                    await make_audio_source(track, local_path, resume_at, guild_id=music.guild_id), on_first_packet
+                )
+                source.expected_sec = float(track.duration) - resume_at if track.duration else None
+                chain = ChainedSource(source, lambda: bot.loop.call_soon_threadsafe(music.next_event.set))
+
+                def after_play(error, chain=chain):
+                    if error:
+                        print("재생 after 에러:", repr(error), flush=True)
+                    chain.finish(error)
+                    bot.loop.call_soon_threadsafe(music.next_event.set)
+
+                try:
+                    # ✅ 재시도(continue)로 들어온 경우 이전 시도의 종료 신호가 남아 있으면 바로 깨어나 버림
+                    music.next_event.clear()
+                    vc.play(chain, after=after_play)
+                    music.play_source, music.play_offset = source, resume_at
+                    if resume_at > 0:
+                        print(f"[이어 재생] {track.title} ({resume_at:.0f}초부터)", flush=True)
+                    else:
+                        print(f"[재생 시작] {track.title}", flush=True)
+                    if audio_cache is not None and not local_path and resume_at == 0:
+                        audio_cache.note_play(track)
+                    await upsert_panel(guild, music)
+                except Exception as e:
+                    print("vc.play 에러:", repr(e), flush=True)
+                    if not music.queue:
+                        music.now_playing = None
+                        touch_command(music)
+                    bot.loop.call_soon_threadsafe(music.next_event.set)
+                    break
 
+            # ✅ 곡이 끝나거나(chain.ended) 다음 곡으로 넘어갈 때(take_switch)까지 대기
+            prespawn = None
+            if PLAYBACK_GAPLESS:
+                prespawn = asyncio.create_task(prespawn_next(guild, music, chain, track, source))
             try:
-                vc.play(source, after=after_play)
-                print(f"[재생 시작] {track.title}", flush=True)
-                await upsert_panel(guild, music)
-            except Exception as e:
-                print("vc.play 에러:", repr(e), flush=True)
-                bot.loop.call_soon_threadsafe(music.next_event.set)
-                break
+                while True:
+                    switched = chain.take_switch()
+                    if switched is not None or chain.ended:
+                        break
+                    await music.next_event.wait()
+                    music.next_event.clear()
+            finally:
+                if prespawn is not None and not prespawn.done():
+                    prespawn.cancel()
+                    await asyncio.gather(prespawn, return_exceptions=True)
 
-            await music.next_event.wait()
             elapsed = time.monotonic() - start_ts
 
-            async with music.lock:
-                was_skip = music.skip_flag
-                # skip_flag는 이번 트랙 종료 처리에서만 소비
+            if switched is not None:
+                # ✅ 지금 곡은 끝까지 재생됐고 다음 곡은 이미 나가는 중 -> 정상 종료 처리 후 바로 다음 곡으로
                 music.skip_flag = False
+                if not switched.replay:
+                    # ✅ 보기만 하고 남겨 뒀던 대기열 맨 앞 곡을 이제 뺌
+                    if music.queue and music.queue[0] is switched.queued:
+                        music.queue.popleft()
+                    if music.repeat_mode == "all":
+                        music.queue.append(track)
+                schedule_prefetch(music)
+                handoff = switched
+                break
+
+            # 준비만 해 두고 못 넘어간 다음 곡은 버림(대기열에서 빼지 않았으므로 그대로 다음 차례)
+            leftover = chain.unstage()
+            if leftover is not None and leftover.source is not None:
+                leftover.source.cleanup()
+
+            music.track_end_ts = time.monotonic()
+
+            was_skip = music.skip_flag
+            # skip_flag는 이번 트랙 종료 처리에서만 소비
+            music.skip_flag = False
 
             # ✅ 사용자가 스킵한 경우는 재시도하지 않음
             if was_skip:
-                async with music.lock:
-                    music.now_playing = None
-                    touch_command(music)
+                music.now_playing = None
+                touch_command(music)
                 await upsert_panel(guild, music)
                 break
 
             # ✅ "즉시 실패"로 판단되면: stream_url 재추출 후 1회 재시도
             if elapsed < EARLY_FAIL_SEC and attempts_left > 0:
                 print(f"즉시 실패로 판단({elapsed:.2f}s). 스트림 재추출 후 재시도.", flush=True)
+                if local_path:
+                    # 캐시 파일이 깨졌을 수 있으니 버리고 스트림으로 재생
+                    audio_cache.discard(track)
                 try:
-                    fresh = await extract_with_retry_single(track.url)
-                    fresh.requester = track.requester
-                    track = fresh
-                    async with music.lock:
-                        music.now_playing = track
+                    track = await extract_with_retry_single(
+                        track.url, fresh_stream=True, requester=track.requester,
+                        guild_id=guild.id, priority=PRIO_NEXT,
+                    )
+                    music.now_playing = track
+                    resume_at += source.position_sec
                     # 다음 루프에서 다시 play
                     continue
                 except Exception as e:
                     print("재추출 실패:", repr(e), flush=True)
                     # 재추출도 실패면 그냥 스킵 처리(다음 곡)
-                    async with music.lock:
-                        music.now_playing = None
-                        touch_command(music)
+                    music.now_playing = None
+                    touch_command(music)
                     await upsert_panel(guild, music)
                     break
 
+            # ✅ 곡 중간에 끊김(URL 만료/연결 끊김): 스트림을 다시 받아 끊긴 위치부터 이어 재생
+            played_to = resume_at + source.position_sec
+            if (
+                recoveries_left > 0
+                and vc.is_connected()
+                and ended_abnormally(track, played_to, chain.errors[0] if chain.errors else None)
+            ):
+                recoveries_left -= 1
+                total = f"/{track.duration:.0f}" if track.duration else ""
+                print(f"[중간 끊김] {track.title} {played_to:.0f}{total}초에서 끊김. 이어 재생 시도.", flush=True)
+                try:
+                    if not local_path:
+                        track = await extract_with_retry_single(
+                            track.url, fresh_stream=True, requester=track.requester,
+                            guild_id=guild.id, priority=PRIO_NEXT,
+                        )
+                    music.now_playing = track
+                    M_MIDTRACK_RECOVERIES.inc(result="resumed")
+                    resume_at = played_to
+                    attempts_left = max(attempts_left, 1)
+                    continue
+                except Exception as e:
+                    M_MIDTRACK_RECOVERIES.inc(result="failed")
+                    print("이어 재생용 재추출 실패:", repr(e), flush=True)
+
             # ✅ 정상 종료(혹은 즉시 실패지만 재시도 기회 소진) -> 반복/큐 처리
-            async with music.lock:
-                if music.repeat_mode == "all":
-                    music.queue.append(track)
-                elif music.repeat_mode == "one":
-                    music.queue.appendleft(track)
+            if music.repeat_mode == "all":
+                music.queue.append(track)
+            elif music.repeat_mode == "one":
+                music.queue.appendleft(track)
+            schedule_prefetch(music)
 
-                if not music.queue:
-                    music.now_playing = None
-                    touch_command(music)
+            if not music.queue:
+                music.now_playing = None
+                touch_command(music)
 
             await upsert_panel(guild, music)
             break
 
 # ==============================
-# 이벤트
+# ✅ 재시작 복원(스냅샷 저장/복원)
 # ==============================
-@bot.event
-async def on_ready():
-    bootlog.info("READY_HIT: %s", bot.user)
-    bot.add_view(MusicControlView())
+SNAPSHOT_VERSION = 2
+# 재생 위치는 이 간격(초)만큼 움직였을 때만 다시 씀
+SNAPSHOT_POSITION_STEP_SEC = 10.0
+# 주기 저장과 퇴장 시 삭제가 엇갈려 지운 파일이 다시 써지지 않게
+_snapshot_io_lock = asyncio.Lock()
+# 종료 직전 마지막 저장을 마치면 True(그 뒤 음성 연결이 끊겨도 스냅샷을 지우지 않음)
+_snapshots_closed = False
+
+def _snapshot_path(guild_id: int) -> str:
+    """출력값: 작은 상태 파일(지금 곡/위치/패널/반복) 경로"""
+    return os.path.join(SNAPSHOT_DIR, f"{guild_id}.json")
+
+def _snapshot_queue_path(guild_id: int) -> str:
+    """출력값: 대기열 파일 경로(대기열이 바뀔 때만 다시 씀)"""
+    return os.path.join(SNAPSHOT_DIR, f"{guild_id}.queue.json.gz")
+
+def _track_row(track: Track, with_stream: bool) -> list:
+    """
+    입력값: 곡, 스트림 URL 포함 여부
+    출력값: [제목, url, 요청자, 길이, 썸네일(, 스트림 URL, 만료 시각)] (키 이름 없이 짧게)
+    """
+    row = [track.title, track.url, track.requester, track.duration, track.thumbnail]
+    if with_stream and track.stream_usable():
+        row += [track.stream_url, track.stream_expire]
+    return row
 
+def _track_from_row(row: list) -> Track:
+    return Track(
+        title=row[0],
+        url=row[1],
+        stream_url=row[5] if len(row) > 5 else None,
+        requester=row[2],
+        duration=row[3],
+        thumbnail=row[4],
+        stream_expire=row[6] if len(row) > 6 else None,
+    )
+
+def snapshot_key(guild: discord.Guild, music: GuildMusic) -> Optional[tuple]:
+    """
+    출력값: 상태 파일 내용이 바뀌었는지 비교할 키(음성 연결이 없거나 비어 있으면 None)
+    - 대기열은 여기 넣지 않음(대기열 파일은 TrackQueue.version이 바뀔 때만 따로 씀)
+    """
+    vc = guild.voice_client
+    if not vc or not vc.is_connected() or vc.channel is None:
+        return None
+    if music.now_playing is None and not music.queue:
+        return None
+    return (
+        vc.channel.id,
+        id(music.now_playing),
+        music.repeat_mode,
+        music.panel_channel_id,
+        music.panel_message_id,
+        int(music.position_sec() // SNAPSHOT_POSITION_STEP_SEC),
+    )
+
+def build_snapshot(guild: discord.Guild, music: GuildMusic) -> dict:
+    """
+    출력값: 한 길드의 작은 상태 기록(지금 곡/위치/패널/반복). 재생 위치가 움직일 때마다 이것만 다시 씀
+    """
+    np = music.now_playing
+    return {
+        "v": SNAPSHOT_VERSION,
+        "ts": time.time(),
+        "voice": guild.voice_client.channel.id,
+        "panel": [music.panel_channel_id, music.panel_message_id],
+        "repeat": music.repeat_mode,
+        "now": _track_row(np, True) if np else None,
+        "pos": round(music.position_sec(), 1),
+    }
+
+def build_snapshot_queue(music: GuildMusic) -> list:
+    """
+    출력값: 대기열 곡 목록(행 리스트)
+    - 스트림 URL은 곧 재생할 PREFETCH_AHEAD곡만(복원 직후 추출 없이 바로 재생)
+    """
+    return [_track_row(t, i < PREFETCH_AHEAD) for i, t in enumerate(music.queue)]
+
+def _write_json(path: str, data, compress: bool):
+    tmp = path + ".tmp"
+    if compress:
+        f = gzip.open(tmp, "wt", encoding="utf-8", compresslevel=5)
+    else:
+        f = open(tmp, "w", encoding="utf-8")
+    with f:
+        json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp, path)
+
+def _write_snapshots(writes: List[Tuple[int, Optional[dict], Optional[list]]], removes: List[int]):
+    """
+    입력값: writes([(길드 id, 상태 또는 None, 대기열 또는 None)] - None이면 그 파일은 그대로), removes(길드 id)
+    - 대기열 파일을 먼저 쓰고 상태 파일을 씀(상태 파일이 있으면 복원 대상)
+    """
+    if writes:
+        os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    for gid, state, queue in writes:
+        if queue is not None:
+            _write_json(_snapshot_queue_path(gid), queue, compress=True)
+        if state is not None:
+            _write_json(_snapshot_path(gid), state, compress=False)
+    for gid in removes:
+        # 예전 형식(<id>.json.gz) 파일도 같이 지움
+        for path in (_snapshot_path(gid), _snapshot_queue_path(gid), _snapshot_path(gid) + ".gz"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+def _read_snapshot(guild_id: int) -> Optional[dict]:
+    """
+    출력값: 상태 기록에 "queue"(대기열 행 리스트)를 붙인 dict. 없거나 형식이 다르면 None
+    """
+    path = _snapshot_path(guild_id)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if not isinstance(data, dict) or data.get("v") != SNAPSHOT_VERSION:
+            return None
+        try:
+            with gzip.open(_snapshot_queue_path(guild_id), "rt", encoding="utf-8") as f:
+                data["queue"] = json.load(f)
+        except FileNotFoundError:
+            data["queue"] = []
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print("[스냅샷] 읽기 실패:", path, repr(e), flush=True)
+        return None
+    return data
+
+def _list_snapshots() -> List[int]:
+    try:
+        names = os.listdir(SNAPSHOT_DIR)
+    except FileNotFoundError:
+        return []
+    ids = set()
+    for name in names:
+        # <id>.json(지금 형식), <id>.json.gz(예전 형식 -> 읽지 못하므로 지워짐)
+        for suffix in (".json", ".json.gz"):
+            if name.endswith(suffix) and name[:-len(suffix)].isdigit():
+                ids.add(int(name[:-len(suffix)]))
+    return sorted(ids)
+
+async def flush_snapshots(final: bool = False):
+    """
+    입력값: final(True면 종료 직전 마지막 저장. 그 뒤로는 저장/삭제하지 않음)
+    출력: 마지막 저장 뒤 바뀐 길드만 모아서 한 번의 스레드 작업으로 씀
+    - 직렬화용 값은 루프에서 만들고(상태를 일관되게 읽음), 압축/디스크 쓰기만 스레드로
+    - 재생 위치만 움직인 길드는 작은 상태 파일만, 대기열 파일은 TrackQueue.version이 바뀐 길드만
+    """
+    global _snapshots_closed
+    async with _snapshot_io_lock:
+        if _snapshots_closed:
+            return
+        await _flush_snapshots_locked()
+        if final:
+            _snapshots_closed = True
+
+async def _flush_snapshots_locked():
+    writes: List[Tuple[int, Optional[dict], Optional[list]]] = []
+    removes: List[int] = []
+    for gid, music in list(music_data.items()):
+        guild = bot.get_guild(gid)
+        if guild is None:
+            continue
+        key = snapshot_key(guild, music)
+        if key is None:
+            if music.snapshot_key is not None:
+                removes.append(gid)
+            music.snapshot_key = music.snapshot_queue_version = None
+            continue
+        queue = None
+        if music.queue.version != music.snapshot_queue_version:
+            queue = build_snapshot_queue(music)
+            music.snapshot_queue_version = music.queue.version
+        state = build_snapshot(guild, music) if key != music.snapshot_key else None
+        music.snapshot_key = key
+        if state is not None or queue is not None:
+            writes.append((gid, state, queue))
+    if writes or removes:
+        await asyncio.to_thread(_write_snapshots, writes, removes)
+
+async def snapshot_writer():
+    while True:
+        await asyncio.sleep(SNAPSHOT_INTERVAL_SEC)
+        try:
+            await flush_snapshots()
+        except Exception as e:
+            print("[스냅샷] 저장 실패:", repr(e), flush=True)
+
+async def discard_snapshot(music: GuildMusic):
+    """출력: 나간 길드의 스냅샷 삭제(재시작 때 다시 들어가지 않게)"""
+    music.snapshot_key = music.snapshot_queue_version = None
+    if not SNAPSHOT_DIR or _snapshots_closed:
+        return
     try:
-        if GUILD_ID and GUILD_ID != 0:
-            guild = discord.Object(id=GUILD_ID)
-            cmds = await asyncio.wait_for(bot.tree.sync(guild=guild), timeout=30)
-            bootlog.info("SYNC_OK(GUILD): %d commands", len(cmds))
+        async with _snapshot_io_lock:
+            await asyncio.to_thread(_write_snapshots, [], [music.guild_id])
+    except Exception as e:
+        print("[스냅샷] 삭제 실패:", repr(e), flush=True)
+
+async def restore_guild(guild_id: int, data: dict) -> bool:
+    """
+    입력값: 길드 id, 스냅샷
+    출력값: 복원했으면 True
+    - 길드/채널이 없거나, 채널에 사람이 없거나, 이미 누가 새로 재생을 시작했으면 건너뜀
+    - 지금 곡은 대기열 맨 앞으로 넣고 저장된 위치부터 이어 재생(player_loop가 restore_offset을 봄)
+    """
+    guild = bot.get_guild(guild_id)
+    channel = guild.get_channel(data.get("voice") or 0) if guild else None
+    if channel is None or not hasattr(channel, "connect"):
+        return False
+    if not any(not m.bot for m in channel.members):
+        return False
+
+    music = get_music(guild_id)
+    if music.now_playing is not None or music.queue or guild.voice_client is not None:
+        return False
+
+    vc = await connect_channel(channel)
+
+    now = _track_from_row(data["now"]) if data.get("now") else None
+    tracks = [_track_from_row(row) for row in data.get("queue") or []]
+    if now is not None:
+        music.queue.append(now)
+        music.restore_offset = (now, float(data.get("pos") or 0.0))
+    music.queue.extend(tracks)
+    music.repeat_mode = data.get("repeat") or "off"
+    music.panel_channel_id, music.panel_message_id = (data.get("panel") or [None, None])[:2]
+    schedule_prefetch(music)
+
+    touch_command(music)
+    if not music.player_task or music.player_task.done():
+        music.player_task = asyncio.create_task(player_loop(guild, music))
+    await upsert_panel(guild, music)
+    print(f"[복원] {guild.name}: {len(music.queue)}곡, {vc.channel.name}", flush=True)
+    return True
+
+async def restore_snapshots():
+    """
+    출력: 저장된 길드를 RESTORE_STAGGER_SEC 간격으로 하나씩 복원
+    - 파일은 차례가 왔을 때 읽음(길드 수가 많아도 한꺼번에 메모리에 올리지 않음)
+    - 추출은 미리 추출(PRIO_PREFETCH)로만 걸리고 저장된 스트림 URL을 먼저 씀 -> 재시작 직후 추출 몰림 없음
+    """
+    ids = await asyncio.to_thread(_list_snapshots)
+    restored = 0
+    for i, gid in enumerate(ids):
+        data = await asyncio.to_thread(_read_snapshot, gid)
+        ok = False
+        if data is not None and time.time() - float(data.get("ts") or 0) <= SNAPSHOT_MAX_AGE_SEC:
+            if restored:
+                await asyncio.sleep(RESTORE_STAGGER_SEC)
+            try:
+                ok = await restore_guild(gid, data)
+            except Exception as e:
+                print("[복원] 실패:", gid, repr(e), flush=True)
+        if ok:
+            restored += 1
         else:
-            cmds = await asyncio.wait_for(bot.tree.sync(), timeout=30)
-            bootlog.info("SYNC_OK(GLOBAL): %d commands", len(cmds))
+            await asyncio.to_thread(_write_snapshots, [], [gid])
+    if ids:
+        bootlog.info("RESTORE: %d/%d guilds", restored, len(ids))
+
+# ==============================
+# 이벤트
+# ==============================
+_ytdl_pool_warmed = False
+
+async def start_metrics_server():
+    """
+    출력: METRICS_HOST:METRICS_PORT/metrics 에서 Prometheus 텍스트 제공(aiohttp는 discord.py 의존성)
+    """
+    from aiohttp import web
+
+    async def handle(request):
+        return web.Response(
+            body=metrics.render().encode("utf-8"),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+        )
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, METRICS_HOST, METRICS_PORT).start()
+    bootlog.info("METRICS: http://%s:%d/metrics", METRICS_HOST, METRICS_PORT)
+
+# ==============================
+# ✅ 슬래시 커맨드 동기화(바뀐 경우에만)
+# ==============================
+def command_tree_hash(guild: Optional[discord.abc.Snowflake]) -> str:
+    """
+    입력값: guild(없으면 전역)
+    출력값: 동기화될 커맨드 목록(이름/설명/옵션/권한 등 Discord로 보내는 그대로)의 sha256
+    """
+    payload = sorted(
+        (cmd.to_dict(bot.tree) for cmd in bot.tree.get_commands(guild=guild)),
+        key=lambda d: (d.get("type", 1), d["name"]),
+    )
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def _load_sync_state() -> Dict[str, str]:
+    try:
+        with open(COMMAND_SYNC_STATE_PATH, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        bootlog.warning("SYNC_STATE_READ_FAIL: %r", e)
+        return {}
+
+def _save_sync_state(state: Dict[str, str]):
+    tmp = COMMAND_SYNC_STATE_PATH + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, COMMAND_SYNC_STATE_PATH)
+
+async def sync_command_tree():
+    """
+    - 커맨드 트리 해시가 마지막 성공 동기화 때와 같으면 REST 호출 없이 넘어감
+    - 다르면 동기화하고, 성공했을 때만 해시 저장(시간 초과/실패면 다음 부팅 때 다시 시도)
+    - on_ready 밖 백그라운드 작업으로 돌려서 준비 처리/재연결을 막지 않음
+    """
+    guild = discord.Object(id=GUILD_ID) if GUILD_ID else None
+    scope = f"{bot.application_id}:" + (f"guild:{GUILD_ID}" if guild else "global")
+    digest = command_tree_hash(guild)
+
+    state = _load_sync_state() if COMMAND_SYNC_STATE_PATH else {}
+    if not COMMAND_SYNC_FORCE and state.get(scope) == digest:
+        bootlog.info("SYNC_SKIP: 커맨드 변경 없음(%s)", digest[:12])
+        return
+
+    try:
+        cmds = await asyncio.wait_for(bot.tree.sync(guild=guild), timeout=COMMAND_SYNC_TIMEOUT_SEC)
     except asyncio.TimeoutError:
-        bootlog.warning("SYNC_TIMEOUT: 30초 내 끝나지 않음")
+        bootlog.warning("SYNC_TIMEOUT: %d초 내 끝나지 않음", COMMAND_SYNC_TIMEOUT_SEC)
+        return
     except Exception as e:
         bootlog.exception("SYNC_FAIL: %r", e)
+        return
+    bootlog.info("SYNC_OK(%s): %d commands", "GUILD" if guild else "GLOBAL", len(cmds))
+
+    if COMMAND_SYNC_STATE_PATH:
+        state[scope] = digest
+        try:
+            await asyncio.to_thread(_save_sync_state, state)
+        except Exception as e:
+            bootlog.warning("SYNC_STATE_WRITE_FAIL: %r", e)
+
+@bot.event
+async def on_ready():
+    global _ytdl_pool_warmed
+    bootlog.info("READY_HIT: %s", bot.user)
+    bot.add_view(MusicControlView())
+
+    # ✅ 추출기 풀 예열/디스크 캐시 저장 루프는 최초 1회만(재연결 시 on_ready가 또 불림)
+    if not _ytdl_pool_warmed:
+        _ytdl_pool_warmed = True
+        # 프로세스 모드면 이 프로세스의 풀은 안 씀(워커가 _extract_worker_init에서 각자 예열)
+        if EXTRACT_BACKEND != "process":
+            asyncio.create_task(asyncio.to_thread(ytdl_pool.warm))
+        if await asyncio.to_thread(open_resolve_store) is not None:
+            asyncio.create_task(resolve_store_flusher())
+        if METRICS_PORT:
+            try:
+                await start_metrics_server()
+            except Exception as e:
+                bootlog.warning("METRICS_FAIL: %r", e)
+        # ✅ 커맨드 동기화도 최초 1회만, 바뀐 경우에만(재연결마다 REST 호출/레이트리밋 낭비 방지)
+        asyncio.create_task(sync_command_tree())
+        if voice_workers is not None:
+            asyncio.create_task(asyncio.to_thread(voice_workers.start))
+        # ✅ 재시작 전 재생하던 길드 복원 + 주기적 스냅샷 저장
+        if SNAPSHOT_DIR:
+            asyncio.create_task(restore_snapshots())
+            asyncio.create_task(snapshot_writer())
 
 # ==============================
 # 슬래시 커맨드
@@ -906,78 +4353,93 @@ async def play(interaction: discord.Interaction, 제목: str):
 
         # 패널은 명령 친 채팅에 생성/유지
         music.panel_channel_id = interaction.channel_id
-        ensure_idle_task(interaction.guild, music)
         await upsert_panel(interaction.guild, music)
 
         # ✅ 플레이리스트 자동 인식
         if is_youtube_playlist_input(제목):
-            # ✅ 플리 처리 중에는 다른 명령 전부 잠금(퇴장만 예외)
-            async with music.busy_lock:
-                # 중복 플리 요청 방지
-                async with music.lock:
-                    if music.is_busy:
-                        raise Exception(MSG_BUSY)
-                    music.is_busy = True
-                    music.playlist_task = asyncio.current_task()
-
-                await upsert_panel(interaction.guild, music)
+            # ✅ 플리는 한 번에 하나만 적재(확인과 차지 사이에 await가 없어서 동시 요청도 하나만 통과)
+            if music.playlist_task is not None and not music.playlist_task.done():
+                raise Exception(MSG_PLAYLIST_LOADING)
+            if music.is_busy:
+                raise Exception(MSG_BUSY)
+            # ✅ 첫 곡이 들어올 때까지만 다른 명령 잠금(퇴장만 예외)
+            music.is_busy = True
+            music.playlist_task = asyncio.current_task()
+
+            await upsert_panel(interaction.guild, music)
+
+            requester_id = interaction.user.id
+            progress_msg = None
+
+            async def on_batch(pairs: List[Tuple[str, str]]):
+                nonlocal progress_msg
+                # ✅ stream_url=None -> 재생 직전(또는 미리 추출)에서 추출
+                for (t, u) in pairs:
+                    music.queue.append(
+                        Track(
+                            title=t,
+                            url=u,
+                            stream_url=None,
+                            requester=requester_id,
+                            duration=None,
+                            thumbnail=None,
+                        )
+                    )
+                schedule_prefetch(music)
+                first_batch = music.is_busy
+                music.is_busy = False
 
-                try:
-                    pairs = await extract_with_retry_playlist_flat(제목, PLAYLIST_LIMIT)
-                    if not pairs:
-                        raise Exception("플레이리스트에서 곡을 못 찾았어.")
-
-                    requester_id = interaction.user.id
-
-                    # ✅ 큐에 100곡 제한으로 적재(stream_url=None -> 재생 직전 추출)
-                    async with music.lock:
-                        for (t, u) in pairs:
-                            music.queue.append(
-                                Track(
-                                    title=t,
-                                    url=u,
-                                    stream_url=None,
-                                    requester=requester_id,
-                                    duration=None,
-                                    thumbnail=None,
-                                )
-                            )
-                        queue_size = len(music.queue)
-
-                    if not music.player_task or music.player_task.done():
-                        music.player_task = asyncio.create_task(player_loop(interaction.guild, music))
+                if not music.player_task or music.player_task.done():
+                    music.player_task = asyncio.create_task(player_loop(interaction.guild, music))
 
+                if first_batch:
                     await upsert_panel(interaction.guild, music)
-
-                    msg = await interaction.followup.send(
-                        f"📃 플레이리스트에서 **{len(pairs)}곡** 추가했어. (최대 {PLAYLIST_LIMIT}곡 제한)\n"
-                        f"현재 대기열 크기: {queue_size}",
+                    progress_msg = await interaction.followup.send(
+                        "📥 플레이리스트 불러오는 중이야. 첫 곡부터 먼저 틀게.",
                         suppress_embeds=True
                     )
-                    await asyncio.sleep(2)
+
+            try:
+                added = await extract_with_retry_playlist_flat(제목, PLAYLIST_LIMIT, on_batch, interaction.guild.id)
+                if not added:
+                    raise Exception("플레이리스트에서 곡을 못 찾았어.")
+
+                queue_size = len(music.queue)
+
+                done_text = (
+                    f"📃 플레이리스트에서 **{added}곡** 추가했어. (최대 {PLAYLIST_LIMIT}곡 제한)\n"
+                    f"현재 대기열 크기: {queue_size}"
+                )
+                if progress_msg is not None:
                     try:
-                        await msg.delete()
+                        await progress_msg.edit(content=done_text)
+                        msg = progress_msg
                     except Exception:
-                        pass
-
-                except asyncio.CancelledError:
-                    # ✅ 퇴장으로 플리 작업이 즉시 중단된 경우
-                    raise
-                finally:
-                    async with music.lock:
-                        music.is_busy = False
-                        music.playlist_task = None
-                    await upsert_panel(interaction.guild, music)
+                        msg = await interaction.followup.send(done_text, suppress_embeds=True)
+                else:
+                    msg = await interaction.followup.send(done_text, suppress_embeds=True)
+                await asyncio.sleep(2)
+                try:
+                    await msg.delete()
+                except Exception:
+                    pass
+
+            except asyncio.CancelledError:
+                # ✅ 퇴장으로 플리 작업이 즉시 중단된 경우
+                raise
+            finally:
+                music.is_busy = False
+                music.playlist_task = None
+                await upsert_panel(interaction.guild, music)
 
             return
 
         # ✅ 단일곡 처리
-        track = await extract_with_retry_single(제목)
-        track.requester = interaction.user.id
+        track = await extract_with_retry_single(제목, requester=interaction.user.id, guild_id=interaction.guild.id)
 
-        async with music.lock:
-            music.queue.append(track)
-            position = len(music.queue)
+        music.queue.append(track)
+        position = len(music.queue)
+        schedule_prefetch(music)
 
         if not music.player_task or music.player_task.done():
             music.player_task = asyncio.create_task(player_loop(interaction.guild, music))
@@ -1015,17 +4477,15 @@ async def priority_play(interaction: discord.Interaction, 제목: str):
         touch_command(music)
 
         music.panel_channel_id = interaction.channel_id
-        ensure_idle_task(interaction.guild, music)
         await upsert_panel(interaction.guild, music)
 
         if is_youtube_playlist_input(제목):
             raise Exception("플레이리스트는 우선예약 말고 /재생으로 넣어줘.")
 
-        track = await extract_with_retry_single(제목)
-        track.requester = interaction.user.id
+        track = await extract_with_retry_single(제목, requester=interaction.user.id, guild_id=interaction.guild.id)
 
-        async with music.lock:
-            music.queue.appendleft(track)
+        music.queue.appendleft(track)
+        schedule_prefetch(music)
 
         if not music.player_task or music.player_task.done():
             music.player_task = asyncio.create_task(player_loop(interaction.guild, music))
@@ -1055,14 +4515,13 @@ async def shuffle_cmd(interaction: discord.Interaction):
 
         music = get_music(interaction.guild.id)
         touch_command(music)
-        ensure_idle_task(interaction.guild, music)
 
-        async with music.lock:
-            if len(music.queue) < 2:
-                ok = False
-            else:
-                shuffle_queue_inplace(music)
-                ok = True
+        if len(music.queue) < 2:
+            ok = False
+        else:
+            shuffle_queue_inplace(music)
+            ok = True
+        schedule_prefetch(music)
 
         await upsert_panel(interaction.guild, music)
         await safe_reply(interaction, "🔀 대기열을 섞었어." if ok else "대기열이 2개 이상 있어야 섞을 수 있어.")
@@ -1080,16 +4539,14 @@ async def repeat_cmd(interaction: discord.Interaction):
 
         music = get_music(interaction.guild.id)
         touch_command(music)
-        ensure_idle_task(interaction.guild, music)
 
-        async with music.lock:
-            if music.repeat_mode == "off":
-                music.repeat_mode = "all"
-            elif music.repeat_mode == "all":
-                music.repeat_mode = "one"
-            else:
-                music.repeat_mode = "off"
-            label = repeat_label(music.repeat_mode)
+        if music.repeat_mode == "off":
+            music.repeat_mode = "all"
+        elif music.repeat_mode == "all":
+            music.repeat_mode = "one"
+        else:
+            music.repeat_mode = "off"
+        label = repeat_label(music.repeat_mode)
 
         await upsert_panel(interaction.guild, music)
         await safe_reply(interaction, f"{label} 로 바꿨어.")
@@ -1107,15 +4564,13 @@ async def skip(interaction: discord.Interaction):
 
         music = get_music(interaction.guild.id)
         touch_command(music)
-        ensure_idle_task(interaction.guild, music)
 
         if not (vc.is_playing() or vc.is_paused()):
             await safe_reply(interaction, "재생중인 음악이 없어.")
             return
 
-        async with music.lock:
-            music.skip_flag = True
-            music.now_playing = None
+        music.skip_flag = True
+        music.now_playing = None
 
         vc.stop()
         await upsert_panel(interaction.guild, music)
@@ -1152,19 +4607,17 @@ async def queue_list(interaction: discord.Interaction):
 
         music = get_music(interaction.guild.id)
         touch_command(music)
-        ensure_idle_task(interaction.guild, music)
 
-        async with music.lock:
-            if not music.queue:
-                await safe_reply(interaction, "대기열이 비어있어.")
-                return
+        view = music.view()
+        if not view.queue_len:
+            await safe_reply(interaction, "대기열이 비어있어.")
+            return
 
-            items = list(music.queue)[:20]
-            lines = [f"{i}. **{t.title}**" for i, t in enumerate(items, start=1)]
-            more = len(music.queue) - len(items)
-            if more > 0:
-                lines.append(f"...그리고 {more}개 더 있어.")
-            msg = "📃 대기열 목록\n" + "\n\n".join(lines)
+        lines = [f"{i}. **{t.title}**" for i, t in enumerate(view.upcoming, start=1)]
+        more = view.queue_len - len(view.upcoming)
+        if more > 0:
+            lines.append(f"...그리고 {more}개 더 있어.")
+        msg = "📃 대기열 목록\n" + "\n\n".join(lines)
 
         await upsert_panel(interaction.guild, music)
         await safe_reply(interaction, msg)
@@ -1187,21 +4640,17 @@ async def queue_remove(interaction: discord.Interaction, 번호: int):
 
         music = get_music(interaction.guild.id)
         touch_command(music)
-        ensure_idle_task(interaction.guild, music)
 
-        async with music.lock:
-            if not music.queue:
-                await safe_reply(interaction, "대기열이 비어있어.")
-                return
+        if not music.queue:
+            await safe_reply(interaction, "대기열이 비어있어.")
+            return
 
-            if 번호 > len(music.queue):
-                await safe_reply(interaction, "그 번호는 없어.")
-                return
+        if 번호 > len(music.queue):
+            await safe_reply(interaction, "그 번호는 없어.")
+            return
 
-            q_list = list(music.queue)
-            removed = q_list.pop(번호 - 1)
-            music.queue.clear()
-            music.queue.extend(q_list)
+        removed = music.queue.remove_at(번호 - 1)
+        schedule_prefetch(music)
 
         await upsert_panel(interaction.guild, music)
         await safe_reply(interaction, f"✅ 취소됨: **{removed.title}**")
@@ -1209,6 +4658,32 @@ async def queue_remove(interaction: discord.Interaction, 번호: int):
     except Exception as e:
         await safe_reply(interaction, safe_text(e))
 
+@bot.tree.command(name="지표", description="(관리자) 추출/연결/재생 지연 통계 보기")
+@app_commands.default_permissions(administrator=True)
+async def metrics_cmd(interaction: discord.Interaction):
+    await safe_defer(interaction, thinking=True)
+
+    try:
+        lines = []
+        for h in metrics.histograms():
+            for key, count, avg, p95 in h.summary():
+                label = f"[{','.join(key)}]" if key else ""
+                lines.append(f"{h.name}{label}: {count}회 평균 {avg:.2f}s p95≤{p95:g}s")
+
+        depths = [len(m.queue) for m in list(music_data.values())]
+        lines.append(
+            f"길드 {len(depths)}개 | 대기열 합계 {sum(depths)} / 최대 {max(depths, default=0)}"
+            f" | 유휴 타이머 {idle_timers.pending()}개 | 정리된 길드 {len(evicted_guilds)}개"
+        )
+
+        text = "📊 지표\n" + "\n".join(lines)
+        if len(text) > 1900:
+            text = text[:1900] + "\n..."
+        await safe_reply(interaction, text, ephemeral=True)
+
+    except Exception as e:
+        await safe_reply(interaction, safe_text(e), ephemeral=True)
+
 if __name__ == "__main__":
     TOKEN = os.getenv("TOKEN")
     if not TOKEN: